@@ -0,0 +1,190 @@
+import numpy as np
+from config import FW_LOCATION
+from routing import distance_matrix, optimize_route
+from spatial import SpatialIndex
+
+MAX_ORDERS_PER_ROBOT = 8              # Maximum number of orders a robot can carry once
+GROUP_RADIUS = 5                      # Orders within this distance of a batch's first order ride along
+ASSIGNMENT_MODES = ('greedy', 'optimal')    # Robots take groups in list order, or by min-cost matching
+UNREACHABLE_COST = 1e9                # Matching cost of a robot that cannot reach a group
+
+
+'''Smart priority: older and closer to its nearest warehouse = higher score'''
+def order_priority(order, now):
+    age = (now - order.created_time) // 1000                                    # How many seconds the order was created.
+    dist = order.warehouse_distance                                             # Precomputed by the simulation (warehouses.Warehouses)
+    if dist is None:
+        dx = order.location[0] - FW_LOCATION[0]                                 # Horizontal distance from warehouse
+        dy = order.location[1] - FW_LOCATION[1]                                 # Vertical distance from warehouse
+        dist = (dx * dx + dy * dy) ** 0.5                                       # Euclidean distance
+    return (age*1.5) - dist                                                     # higher = better (older with stronger bias & closer)
+
+
+"""One robot's share of an assignment round
+
+`group` holds every order taken for the robot; `sequence` is the group in delivery order and `paths`
+the path to each stop, or both are None when no route through the group was found.
+"""
+class Batch:
+    __slots__ = ('robot', 'start', 'group', 'sequence', 'paths')
+
+    def __init__(self, robot, start, group, sequence, paths):
+        self.robot = robot              # Key of the robot (its index in the simulation)
+        self.start = start              # Where the robot was when the batch was planned
+        self.group = group
+        self.sequence = sequence
+        self.paths = paths
+
+
+'''Split the unassigned orders into at most `count` groups, one per idle robot
+
+Each group is the best-priority order left plus up to `max_orders - 1` unassigned orders within
+`radius` of it, best priority first. Groups never share an order. `index` is a snapshot of the
+order store's index (SpatialIndex.snapshot()) holding exactly the `unassigned` orders; it is used
+up by the round. Without one, an index of `unassigned` is built first.
+'''
+def group_orders(unassigned, count, now, max_orders=MAX_ORDERS_PER_ROBOT, radius=GROUP_RADIUS, index=None):
+    unassigned = sorted(unassigned, key=lambda order: order_priority(order, now), reverse=True)
+    rank = {order.order_id: i for i, order in enumerate(unassigned)}            # Position in priority order, to rank nearby orders
+    if index is None:
+        index = SpatialIndex()                                                  # Orders still free in this round
+        for order in unassigned:
+            index.add(order)
+    taken = set()
+    groups = []
+    next_base = 0
+    while len(groups) < count:
+        while next_base < len(unassigned) and unassigned[next_base].order_id in taken:
+            next_base += 1                                                      # skip orders already grouped into a batch
+        if next_base == len(unassigned):
+            break
+        base_order = unassigned[next_base]                                      # Take one order and try to find nearby ones
+        group = [base_order]                                                    # Build a group of nearby orders
+        taken.add(base_order.order_id)
+        index.mark_assigned(base_order)
+
+        # Group nearby orders up to MAX, highest priority first
+        nearby = index.query_radius(base_order.location, radius)
+        nearby.sort(key=lambda order: rank[order.order_id])
+        for other in nearby[:max_orders - 1]:
+            group.append(other)
+            taken.add(other.order_id)
+            index.mark_assigned(other)
+        groups.append(group)
+    return groups
+
+
+'''Shortest route from `start` through `locations`: (stop order as indices into `locations`, path to each stop)
+
+Exact for small groups, heuristic for big ones; (None, None) if some stop cannot be reached.
+'''
+def route_stops(distances, start, locations, optimizer='auto'):
+    matrix = distance_matrix(distances, start, locations)
+    route = optimize_route(matrix, optimizer)
+    if not route:
+        return None, None
+    paths = [distances.path(locations[route[0] - 1], start)[::-1]]              # The start's field (already flooded), backwards
+    last_pos = locations[route[0] - 1]
+    for stop in route[1:]:
+        paths.append(distances.path(last_pos, locations[stop - 1]))             # Descend the cached field instead of a new search
+        last_pos = locations[stop - 1]
+    return [stop - 1 for stop in route], paths
+
+
+'''Min-cost assignment of every row to a column that takes up to `capacity[j]` rows (sum >= rows)
+
+Returns the column of each row. Rows are added one at a time along the cheapest augmenting path:
+the new row takes a column, and maybe pushes a row of that column into another one, and so on until
+a column with room is reached. The path is a Bellman-Ford search over the columns alone, with the
+cheapest move of one of its rows between every two columns as edges, so each row costs
+O(rows x columns + columns^3) in NumPy: meant for a few columns shared by many rows.
+'''
+def transport(cost, capacity):
+    n, m = cost.shape
+    column = np.full(n, -1, dtype=np.int64)
+    load = np.zeros(m, dtype=np.int64)
+    room = np.asarray(capacity) > 0
+    every = np.arange(m)
+    for i in range(n):
+        step = np.full((m, m), np.inf)          # step[p, q]: least extra cost of moving a row from p to q
+        via = np.zeros((m, m), dtype=np.int64)  # ... and that row
+        for p in np.flatnonzero(load):
+            rows = np.flatnonzero(column == p)
+            moves = cost[rows] - cost[rows, p][:, None]
+            best = moves.argmin(axis=0)
+            step[p] = moves[best, every]
+            via[p] = rows[best]
+        dist = cost[i].copy()
+        previous = np.full(m, -1)
+        for _ in range(m - 1):
+            reached = dist[:, None] + step
+            source = reached.argmin(axis=0)
+            reached = reached[source, every]
+            better = reached < dist
+            if not better.any():
+                break
+            dist[better] = reached[better]
+            previous[better] = source[better]
+        q = int(np.argmin(np.where(room, dist, np.inf)))
+        load[q] += 1
+        room[q] = load[q] < capacity[q]
+        while previous[q] >= 0:                 # Shift one row along each column of the path
+            p = previous[q]
+            column[via[p, q]] = q
+            q = p
+        column[i] = q
+    return column.tolist()
+
+
+'''Pair each group with a robot: (key, position, group) triples
+
+"greedy" gives the i-th group to the i-th robot. "optimal" picks the pairing with the least total
+moves from each robot to its group's closest order. Only robots idle at a warehouse are offered, so
+it differs from "greedy" once there are several warehouses; the robots then stand on a handful of
+cells, so the robots on one cell are one column of a group x cell matrix, answered by one cached
+distance field and taking as many groups as there are robots on it (transport()). Each cell's robots
+take its groups in order.
+'''
+def pair_groups(groups, robots, distances, mode='greedy'):
+    if mode == 'greedy' or not groups:
+        return [(key, position, group) for (key, position), group in zip(robots, groups)]
+    locations = [order.location for group in groups for order in group]
+    xs = np.array([location[0] for location in locations])
+    ys = np.array([location[1] for location in locations])
+    starts = np.cumsum([0] + [len(group) for group in groups[:-1]])            # First order of each group
+    columns = {}
+    for column, (_, position) in enumerate(robots):
+        columns.setdefault(position, []).append(column)
+    positions = list(columns)
+    cost = np.empty((len(groups), len(positions)))
+    for j, position in enumerate(positions):
+        moves = distances.field(position)[xs, ys].astype(float)
+        moves[moves < 0] = np.inf
+        cost[:, j] = np.minimum.reduceat(moves, starts)
+    cost[np.isinf(cost)] = UNREACHABLE_COST
+    chosen = transport(cost, [len(columns[position]) for position in positions])
+    free = {position: iter(shared) for position, shared in columns.items()}
+    return [robots[next(free[positions[j]])] + (group,) for j, group in zip(chosen, groups)]
+
+
+'''Plan one assignment round without changing anything
+
+`unassigned` are the orders to hand out and `robots` the idle robots as (key, position), in the
+order they get served: groups from group_orders() are paired with robots by pair_groups() and
+visited along the shortest route from their robot. Only reads the orders' ids, locations and
+creation times (and `index`, a snapshot of the store's buckets), so it can run away from the simulation.
+'''
+def plan_batches(unassigned, robots, now, distances, optimizer='auto',
+                 max_orders=MAX_ORDERS_PER_ROBOT, radius=GROUP_RADIUS, mode='greedy', index=None):
+    batches = []
+    groups = group_orders(unassigned, len(robots), now, max_orders, radius, index)
+    for key, position, group in pair_groups(groups, robots, distances, mode):
+        route, paths = route_stops(distances, position, [order.location for order in group], optimizer)
+        batches.append(make_batch(key, position, group, route, paths))
+    return batches
+
+
+'''Batch of `group` for robot `key`, from a route as returned by route_stops()'''
+def make_batch(key, position, group, route, paths):
+    sequence = [group[stop] for stop in route] if route is not None else None
+    return Batch(key, position, group, sequence, paths)
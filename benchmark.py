@@ -0,0 +1,170 @@
+"""Pathfinding benchmark: every planner on the same seeded maps and queries, checked against Dijkstra
+
+Maps come from generate_map() at each size and obstacle ratio with a fixed seed, and each map gets a
+fixed set of start / goal pairs of free cells (reachable and unreachable alike). Every planner runs
+the whole set; a case reports the time per query (best of the repeats), the nodes it expanded
+(pathfinding.search_stats), the peak memory allocated while answering the set (tracemalloc, with the
+planner's per-grid caches already built by the timed runs) and the mean path length. Paths are
+validated move by move and their length compared with Dijkstra's, which is optimal here.
+
+Results can be saved as a baseline and later runs compared with it, failing on slower cases,
+more nodes expanded, invalid paths or new suboptimal paths:
+
+    python benchmark.py --save-baseline bench.json
+    python benchmark.py --baseline bench.json
+    python benchmark.py --sizes 128 256 --planner astar jps hpa --baseline bench.json
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from config import MAP_SIZE, OBSTACLE_RATIO, FW_LOCATION
+from map import generate_map
+from pathfinding import PLANNERS, NEIGHBORS, dijkstra, search_stats
+
+SIZES = (MAP_SIZE, 64)                # dfs copies its path per stack entry, so much larger maps take minutes
+OBSTACLE_RATIOS = (0.1, OBSTACLE_RATIO, 0.3)
+QUERIES = 50                          # Start / goal pairs per map
+REPEATS = 3                           # Timed runs of each query set; the fastest counts
+SLOWDOWN_TOLERANCE = 0.25             # Time per query may grow this much over the baseline before it is a regression
+FIELDS = ('size', 'obstacle_ratio', 'planner')
+
+
+'''Fixed start / goal pairs on free cells of `grid`; the same seed gives the same pairs'''
+def query_set(grid, count=QUERIES, seed=0):
+    rng = random.Random(seed)
+    free = [(int(x), int(y)) for x, y in zip(*(grid == 0).nonzero())]
+    return [(rng.choice(free), rng.choice(free)) for _ in range(count)]
+
+
+'''Moves of `path` from `start` to `goal`, or None if it is not a valid path over free cells'''
+def path_moves(grid, path, start, goal):
+    if not path or path[0] != start or path[-1] != goal:
+        return None
+    h, w = grid.shape
+    for a, b in zip(path, path[1:]):
+        if (b[0] - a[0], b[1] - a[1]) not in NEIGHBORS:
+            return None
+    if any(not (0 <= x < h and 0 <= y < w) or grid[x, y] != 0 for x, y in path):
+        return None
+    return len(path) - 1
+
+
+'''Benchmark one planner on one map's query set against Dijkstra's answers (moves, or None if unreachable)'''
+def run_case(planner, grid, queries, reference, repeats=REPEATS):
+    search = PLANNERS[planner]
+    search(grid, *queries[0])                           # Build the per-grid caches outside the timings
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for start, goal in queries:
+            search(grid, start, goal)
+        best = min(best, time.perf_counter() - started)
+
+    search_stats.reset()
+    tracemalloc.start()
+    try:
+        paths = [search(grid, start, goal) for start, goal in queries]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    expanded = search_stats.snapshot().get(planner, {'expanded': 0})['expanded']
+
+    invalid = suboptimal = 0
+    lengths = []
+    for (start, goal), path, optimal in zip(queries, paths, reference):
+        if path is None:
+            invalid += optimal is not None              # Missed a path that exists
+            continue
+        moves = path_moves(grid, path, start, goal)
+        if moves is None or optimal is None:
+            invalid += 1
+            continue
+        lengths.append(moves)
+        suboptimal += moves > optimal
+    return dict(
+        ms_per_query=round(best * 1000 / len(queries), 4),
+        expanded_per_query=round(expanded / len(queries), 1),
+        peak_kib=round(peak / 1024, 1),
+        mean_path_length=round(statistics.fmean(lengths), 2) if lengths else 0.0,
+        invalid=invalid,
+        suboptimal=suboptimal,
+    )
+
+
+'''Run every planner on every map; one result row per (size, obstacle ratio, planner)'''
+def run_benchmark(sizes=SIZES, obstacle_ratios=OBSTACLE_RATIOS, planners=tuple(PLANNERS), queries=QUERIES,
+                  seed=0, repeats=REPEATS):
+    rows = []
+    for size in sizes:
+        for ratio in obstacle_ratios:
+            grid, _ = generate_map(size, ratio, seed=seed)
+            query_list = query_set(grid, queries, seed)
+            reference = []
+            for start, goal in query_list:
+                path = dijkstra(grid, start, goal)
+                reference.append(len(path) - 1 if path is not None else None)
+            for planner in planners:
+                row = dict(size=size, obstacle_ratio=ratio, planner=planner, queries=queries, seed=seed)
+                row.update(run_case(planner, grid, query_list, reference, repeats))
+                rows.append(row)
+                print(f"[INFO] {size}x{size} ratio={ratio} {planner}: {row['ms_per_query']:.3f} ms/query, "
+                      f"{row['expanded_per_query']} expanded, {row['peak_kib']} KiB peak, "
+                      f"{row['invalid']} invalid, {row['suboptimal']} suboptimal")
+    return rows
+
+
+'''Regressions of `rows` against `baseline` rows, as messages; cases missing from the baseline are skipped'''
+def compare(rows, baseline, tolerance=SLOWDOWN_TOLERANCE):
+    previous = {tuple(row[name] for name in FIELDS): row for row in baseline}
+    problems = []
+    for row in rows:
+        case = ' '.join(f"{name}={row[name]}" for name in FIELDS)
+        if row['invalid']:
+            problems.append(f"{case}: {row['invalid']} invalid paths")
+        old = previous.get(tuple(row[name] for name in FIELDS))
+        if old is None:
+            continue
+        if row['ms_per_query'] > old['ms_per_query'] * (1 + tolerance):
+            problems.append(f"{case}: {row['ms_per_query']:.3f} ms/query, was {old['ms_per_query']:.3f}")
+        if row['expanded_per_query'] > old['expanded_per_query']:
+            problems.append(f"{case}: {row['expanded_per_query']} nodes expanded/query, was {old['expanded_per_query']}")
+        if row['suboptimal'] > old['suboptimal']:
+            problems.append(f"{case}: {row['suboptimal']} suboptimal paths, was {old['suboptimal']}")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the FOODIE path planners on seeded maps")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--obstacle-ratio', type=float, nargs='+', default=list(OBSTACLE_RATIOS))
+    parser.add_argument('--planner', nargs='+', default=list(PLANNERS), choices=sorted(PLANNERS))
+    parser.add_argument('--queries', type=int, default=QUERIES, help="Start / goal pairs per map")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="Timed runs per case, the fastest counts")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the maps and the queries")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write the results as a JSON baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare with a saved baseline, exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=SLOWDOWN_TOLERANCE,
+                        help="Allowed relative slowdown per case when comparing with --baseline")
+    args = parser.parse_args()
+
+    if min(args.sizes) <= max(FW_LOCATION):
+        parser.error(f"every map size must be larger than {max(FW_LOCATION)} to hold the warehouse at {FW_LOCATION}")
+
+    rows = run_benchmark(args.sizes, args.obstacle_ratio, args.planner, args.queries, args.seed, args.repeats)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(rows, f, indent=1)
+        print(f"[INFO] Saved {len(rows)} cases to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(rows, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"[WARNING] Regression: {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"[INFO] No regressions against {args.baseline}")
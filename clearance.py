@@ -0,0 +1,84 @@
+import numpy as np
+
+CLEARANCE_RADIUS = 2                  # Robots look this many cells around them for obstacles (a 5x5 window)
+SPEED_DELAYS = {"cautious": 3, "normal": 2, "fast": 1}  # Delay in ticks per speed mode
+
+
+'''Chooses a speed mode based on how close the nearest obstacle is'''
+def speed_mode(dist):
+    if dist <= 1:
+        return "cautious"  # slow
+    elif dist <= 3:
+        return "normal"    # medium
+    else:
+        return "fast"      # fast
+
+
+# Euclidean distance to the nearest obstacle within `radius` cells (inf if none) for rows/cols of the grid.
+def _clearance(padded, radius, rows, cols):
+    result = np.full((rows.stop - rows.start, cols.stop - cols.start), np.inf)
+    for di in range(-radius, radius + 1):
+        for dj in range(-radius, radius + 1):
+            shifted = padded[rows.start + radius + di:rows.stop + radius + di,
+                             cols.start + radius + dj:cols.stop + radius + dj]
+            np.minimum(result, np.where(shifted, np.hypot(di, dj), np.inf), out=result)
+    return result
+
+
+"""Precomputed obstacle clearance and speed delay for every cell
+
+The map is static, so the 5x5 obstacle scan each robot used to do per tick is done once for the
+whole grid with NumPy, and patched locally with update() when a cell changes.
+"""
+class ClearanceMap:
+    def __init__(self, grid, radius=CLEARANCE_RADIUS):
+        self.grid = grid
+        self.radius = radius
+        h, w = grid.shape
+        rows, cols = slice(0, h), slice(0, w)
+        self.distance = _clearance(self._padded(rows, cols), radius, *self._local(rows, cols))    # Distance to nearest obstacle
+        self.delay = self._delays(self.distance)                                       # Ticks to wait before each move
+
+    '''Clearance map of `grid` from previously computed `distance` and `delay` arrays (they are patched in place)'''
+    @classmethod
+    def from_arrays(cls, grid, distance, delay, radius=CLEARANCE_RADIUS):
+        clearance = cls.__new__(cls)
+        clearance.grid = grid
+        clearance.radius = radius
+        clearance.distance = distance
+        clearance.delay = delay
+        return clearance
+
+    # Obstacle mask of rows/cols plus a `radius` margin, padded with free cells outside the grid
+    def _padded(self, rows, cols):
+        h, w = self.grid.shape
+        r = self.radius
+        padded = np.zeros((rows.stop - rows.start + 2 * r, cols.stop - cols.start + 2 * r), dtype=bool)
+        top, bottom = max(0, rows.start - r), min(h, rows.stop + r)
+        left, right = max(0, cols.start - r), min(w, cols.stop + r)
+        padded[top - rows.start + r:bottom - rows.start + r,
+               left - cols.start + r:right - cols.start + r] = self.grid[top:bottom, left:right] != 0
+        return padded
+
+    @staticmethod
+    def _local(rows, cols):
+        return slice(0, rows.stop - rows.start), slice(0, cols.stop - cols.start)
+
+    def _delays(self, distance):
+        delay = np.full(distance.shape, SPEED_DELAYS["fast"], dtype=np.uint8)
+        delay[distance <= 3] = SPEED_DELAYS["normal"]
+        delay[distance <= 1] = SPEED_DELAYS["cautious"]
+        return delay
+
+    '''Speed mode at a cell, O(1)'''
+    def speed_mode(self, cell):
+        return speed_mode(self.distance[cell])
+
+    '''Recompute the cells whose window contains `cell` after it changed'''
+    def update(self, cell):
+        h, w = self.grid.shape
+        rows = slice(max(0, cell[0] - self.radius), min(h, cell[0] + self.radius + 1))
+        cols = slice(max(0, cell[1] - self.radius), min(w, cell[1] + self.radius + 1))
+        distance = _clearance(self._padded(rows, cols), self.radius, *self._local(rows, cols))
+        self.distance[rows, cols] = distance
+        self.delay[rows, cols] = self._delays(distance)
@@ -0,0 +1,48 @@
+"""Time sources for the simulation.
+
+Everything that needs "now" (robots, order generation, assignment) reads it from a clock object
+instead of calling pygame directly, so the same logic can run in a window or headless.
+"""
+
+TICK_RATE = 20                        # Ticks per second of the visual simulation
+TICK_MS = 1000 // TICK_RATE           # Simulated milliseconds per tick
+
+
+"""Wall-clock time from pygame, used by the visual simulation
+
+"""
+class PygameClock:
+    def __init__(self):
+        import pygame
+        self._pygame = pygame
+        self._clock = pygame.time.Clock()
+
+    '''Milliseconds since pygame.init()'''
+    def get_ticks(self):
+        return self._pygame.time.get_ticks()
+
+    '''Wait so the loop runs at most `rate` ticks per second'''
+    def tick(self, rate=TICK_RATE):
+        return self._clock.tick(rate)
+
+
+"""Simulated time that only moves when the simulation advances it
+
+"""
+class VirtualClock:
+    def __init__(self, start_ms=0, tick_ms=TICK_MS):
+        self.now = start_ms             # Current simulated time in milliseconds
+        self.tick_ms = tick_ms          # How far one tick() moves the clock
+
+    '''Current simulated time in milliseconds'''
+    def get_ticks(self):
+        return self.now
+
+    '''Advance one tick without sleeping'''
+    def tick(self, rate=None):
+        self.now += self.tick_ms
+        return self.tick_ms
+
+    '''Advance the clock by an arbitrary number of milliseconds'''
+    def advance(self, ms):
+        self.now += ms
@@ -1,3 +1,4 @@
 MAP_SIZE = 25 # The width and height of the square grid 
 OBSTACLE_RATIO = 0.22 # The fraction of the grid to fill with obstacles
-FW_LOCATION = (12, 12) # Warehouse Locations
\ No newline at end of file
+FW_LOCATION = (12, 12) # Warehouse Locations
+WAREHOUSES = [FW_LOCATION] # Every warehouse; robots return to the nearest one (the first is the main warehouse)
@@ -0,0 +1,283 @@
+import heapq
+from collections import OrderedDict
+import numpy as np
+from pathfinding import NEIGHBORS       # Same 8-connected, uniform-cost moves as the planners
+
+UNREACHABLE = -1
+
+
+# Breadth-first flood from `source`: the number of moves from every cell to `source`, -1 where unreachable.
+# Each level is expanded at once in NumPy, so the cost is a few array operations per level, not per cell.
+# With `targets` the flood stops at the level where the last of them is reached, and returns
+# (field, complete): cells farther away are left at -1 unless `complete` (the whole map was flooded).
+def distance_field(grid, source, targets=None):
+    if targets is None:
+        return _flood(grid, [source])[0]
+    dist, _, complete = _flood(grid, [source], targets=targets)
+    return dist, complete
+
+
+# Breadth-first flood from all `sources` at once: the moves from every cell to its nearest source and the
+# index of that source in `sources`, both -1 where no source is reachable. Ties go to the source listed first.
+def nearest_source_field(grid, sources):
+    return _flood(grid, sources, labels=True)[:2]
+
+
+# Level-synchronous flood on the grid padded with a ring of obstacles, so no bounds checks are needed.
+# The frontier stays sorted by source index (the sources are listed in order and each level keeps the
+# order of the cells that reached it), so a cell reached from several sources gets the first one.
+def _flood(grid, sources, labels=False, targets=None):
+    h, w = grid.shape
+    width = w + 2
+    open_cells = np.pad(grid == 0, 1, constant_values=False).ravel()    # Free and not reached yet
+    offsets = np.array([i * width + j for i, j in NEIGHBORS], dtype=np.int64)
+    dist = np.full(open_cells.size, UNREACHABLE, dtype=np.int32)
+    nearest = np.full(open_cells.size, UNREACHABLE, dtype=np.int32) if labels else None
+    slot = np.empty(open_cells.size, dtype=np.int64)                    # Scratch for dropping repeated cells
+
+    frontier = []
+    for index, source in enumerate(sources):
+        start = (source[0] + 1) * width + source[1] + 1
+        if dist[start] == UNREACHABLE:
+            dist[start] = 0
+            if labels:
+                nearest[start] = index
+            frontier.append(start)
+    frontier = np.array(frontier, dtype=np.int64)
+    open_cells[frontier] = False
+    if targets is not None:
+        targets = np.array([(x + 1) * width + y + 1 for x, y in targets], dtype=np.int64)
+    d = 0
+    while frontier.size:
+        if targets is not None and (dist[targets] != UNREACHABLE).all():
+            break
+        d += 1
+        reached = (frontier[:, None] + offsets).ravel()
+        keep = open_cells[reached]
+        reached = reached[keep]
+        if labels:
+            _, first = np.unique(reached, return_index=True)
+            first.sort()                                                # First occurrence of each cell, in frontier order
+            nearest[reached[first]] = np.repeat(nearest[frontier], len(offsets))[keep][first]
+            frontier = reached[first]
+        else:
+            order = np.arange(reached.size)
+            slot[reached] = order
+            frontier = reached[slot[reached] == order]                  # One occurrence of each cell
+        open_cells[frontier] = False
+        dist[frontier] = d
+
+    crop = lambda values: values.reshape(h + 2, width)[1:-1, 1:-1].copy()
+    return crop(dist), crop(nearest) if labels else None, not frontier.size
+
+
+# Bring a distance_field() or nearest_source_field() result up to date in place after `cells` were blocked
+# or freed, visiting only the cells whose distance or nearest source can change: the ones that lost every
+# neighbor one move closer, then whatever the new cells and the freed ones can reach sooner. Gives the same
+# arrays as flooding again, ties included (a cell's source is the first one among its closer neighbors).
+# Returns the changed cells, or None once more than `limit` cells were visited (the arrays are then
+# half updated: flood again).
+def repair_field(grid, dist, cells, nearest=None, limit=None):
+    h, w = grid.shape
+    if limit is None:
+        limit = max(1024, grid.size // 50)
+    changed, lost, heap = set(), [], []
+
+    def neighbors(x, y):
+        for i, j in NEIGHBORS:
+            nx, ny = x + i, y + j
+            if 0 <= nx < h and 0 <= ny < w and grid[nx, ny] == 0:
+                yield nx, ny
+
+    def children(cell, d):
+        for neighbor in neighbors(*cell):
+            if dist[neighbor] == d + 1:
+                heapq.heappush(heap, (d + 1, neighbor))
+
+    # Cells that lost their closer neighbors, in increasing distance so a cell is judged after all closer ones
+    for cell in cells:
+        if grid[cell] != 0 and dist[cell] != UNREACHABLE:
+            d = int(dist[cell])
+            dist[cell] = UNREACHABLE
+            if nearest is not None:
+                nearest[cell] = UNREACHABLE
+            changed.add(cell)
+            children(cell, d)
+        elif grid[cell] == 0 and dist[cell] == UNREACHABLE:
+            lost.append(cell)
+    visited = 0
+    while heap:
+        d, cell = heapq.heappop(heap)
+        if dist[cell] != d:
+            continue                    # Already lost, or judged at this distance
+        visited += 1
+        if visited > limit:
+            return None
+        closer = [neighbor for neighbor in neighbors(*cell) if dist[neighbor] == d - 1]
+        if not closer:
+            dist[cell] = UNREACHABLE
+            if nearest is not None:
+                nearest[cell] = UNREACHABLE
+            lost.append(cell)
+            changed.add(cell)
+            children(cell, d)
+        elif nearest is not None:
+            label = min(nearest[neighbor] for neighbor in closer)
+            if label != nearest[cell]:
+                nearest[cell] = label
+                changed.add(cell)
+                children(cell, d)
+
+    # Flood the lost and freed cells again from their reached neighbors, lowering any cell reached sooner
+    for cell in lost:
+        for neighbor in neighbors(*cell):
+            if dist[neighbor] != UNREACHABLE:
+                label = int(nearest[neighbor]) if nearest is not None else 0
+                heapq.heappush(heap, (int(dist[neighbor]) + 1, label, cell))
+    while heap:
+        d, label, cell = heapq.heappop(heap)
+        current = dist[cell]
+        if current != UNREACHABLE and (current < d or (current == d and (nearest is None or nearest[cell] <= label))):
+            continue
+        visited += 1
+        if visited > limit:
+            return None
+        dist[cell] = d
+        if nearest is not None:
+            nearest[cell] = label
+        changed.add(cell)
+        for neighbor in neighbors(*cell):
+            current = dist[neighbor]
+            if (current == UNREACHABLE or current > d + 1 or
+                    (current == d + 1 and nearest is not None and nearest[neighbor] > label)):
+                heapq.heappush(heap, (d + 1, label, neighbor))
+    return changed
+
+
+# Shortest path from `start` to the field's source (both included), stepping to a neighbor one move closer each time.
+def descend(field, start):
+    d = field[start]
+    if d == UNREACHABLE:
+        return None
+    h, w = field.shape
+    path = [start]
+    x, y = start
+    while d > 0:
+        for i, j in NEIGHBORS:
+            nx, ny = x + i, y + j
+            if 0 <= nx < h and 0 <= ny < w and field[nx, ny] == d - 1:
+                x, y = nx, ny
+                break
+        d -= 1
+        path.append((x, y))
+    return path
+
+
+"""Answers shortest-path distances and paths from memoized distance fields
+
+Each field is one flood fill from a source cell (the warehouse, an order location, ...).
+Fields are kept in LRU order and evicted beyond `max_fields`; call invalidate() when the grid changes.
+distances() only floods as far as the points it is asked about, so the moves between the nearby
+stops of a batch cost a flood of the neighborhood instead of the whole map; those partial fields
+are cached apart and still answer path() queries between the points they reached.
+"""
+class DistanceOracle:
+    def __init__(self, grid, max_fields=64):
+        self.grid = grid                # Map the fields are computed on
+        self.max_fields = max_fields    # Number of fields kept before evicting the least recently used
+        self.fields = OrderedDict()     # source -> distance field                        ex: {(12, 12): array([[...]])}
+        self.partial = OrderedDict()    # source -> field flooded only as far as some points, -1 beyond
+        self.version = 0                # Bumped every time the cached fields are dropped
+
+    '''Distance field to `source`, computed on first use'''
+    def field(self, source):
+        field = self.fields.get(source)
+        if field is not None:
+            self.fields.move_to_end(source)
+            return field
+        field = distance_field(self.grid, source)
+        self.fields[source] = field
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+        return field
+
+    '''Use a precomputed distance field for `source`, e.g. one saved with the map'''
+    def preload(self, source, field):
+        self.fields[source] = field
+        self.fields.move_to_end(source)
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+
+    '''Moves from `source` to each of `points` as an array, -1 where unreachable, flooding only as far as needed'''
+    def distances(self, source, points):
+        xs = np.array([point[0] for point in points])
+        ys = np.array([point[1] for point in points])
+        field = self.fields.get(source)
+        if field is not None:
+            self.fields.move_to_end(source)
+            return field[xs, ys]
+        field = self.partial.get(source)
+        if field is not None:
+            moves = field[xs, ys]
+            if (moves != UNREACHABLE).all():
+                self.partial.move_to_end(source)
+                return moves
+        field, complete = distance_field(self.grid, source, points)
+        self.partial.pop(source, None)
+        cache = self.fields if complete else self.partial    # A flood that ran out of cells is a whole field
+        cache[source] = field
+        if len(cache) > self.max_fields:
+            cache.popitem(last=False)
+        return field[xs, ys]
+
+    '''Number of moves between a and b, or None if b cannot be reached'''
+    def distance(self, a, b):
+        if a in self.fields:                                    # Moves are symmetric, so either field answers it
+            d = self.field(a)[b]
+        else:
+            d = self.field(b)[a]
+        return None if d == UNREACHABLE else int(d)
+
+    '''Shortest path from start to goal (both included), found by descending the goal's field
+
+    A partial field that reached `start` gives the same path as the whole one: the descent only
+    visits cells closer to the goal than `start`, and those were all flooded.
+    '''
+    def path(self, start, goal):
+        if goal not in self.fields:
+            field = self.partial.get(goal)
+            if field is not None and field[start] != UNREACHABLE:
+                return descend(field, start)
+        return descend(self.field(goal), start)
+
+    '''Drop every cached field, e.g. after obstacles change
+
+    Given the changed `cells`, whole fields are kept and repaired in place (see repair_field()) instead,
+    unless the change reaches too far into them; partial fields are always dropped.
+    '''
+    def invalidate(self, cells=None):
+        self.partial.clear()
+        self.version += 1
+        if cells is None:
+            self.fields.clear()
+            return
+        for source, field in list(self.fields.items()):
+            if source in cells:
+                del self.fields[source]
+            elif _reaches(self.grid, field, cells):
+                if not field.flags.writeable:
+                    field = self.fields[source] = field.copy()     # Preloaded from a map file (read-only)
+                if repair_field(self.grid, field, cells) is None:
+                    del self.fields[source]
+
+
+# Whether changing `cells` can alter `field`: a blocked cell the field reached, or a freed one next to it
+def _reaches(grid, field, cells):
+    h, w = grid.shape
+    for x, y in cells:
+        if grid[x, y] != 0:
+            if field[x, y] != UNREACHABLE:
+                return True
+        elif (field[max(x - 1, 0):x + 2, max(y - 1, 0):y + 2] != UNREACHABLE).any():
+            return True
+    return False
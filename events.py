@@ -0,0 +1,192 @@
+import heapq
+from fleet import WAREHOUSE_WAIT_MS
+
+ORDER_ARRIVAL = 0                     # Event phases, in the order the tick loop runs them within one tick
+ASSIGNMENT = 1
+ROBOT = 2                             # Next move of a robot, or the end of its warehouse wait
+EXTERNAL = 3                          # Callbacks scheduled with at(), e.g. map changes
+ORDER_PERIOD = 10                     # Ticks between order arrivals (and between assignment rounds)
+
+
+"""Discrete-event engine that runs a headless Simulation with the same outcomes as its tick loop
+
+Instead of calling Robot.move() for every robot on every tick, each robot has one pending event: the
+next tick at which move() does more than count down its speed delay or keep waiting at the warehouse.
+The skipped ticks are replayed in bulk (move_delay catches up) right before the event, so the work
+is proportional to moves and order events rather than ticks x robots. Events of one tick run in the
+tick loop's order: order arrival, assignment, robots by index, then external callbacks.
+
+Robots idle at the warehouse repeat the same wait / count down / check cycle until they are given
+orders, so they are parked without events and their state is worked out from the cycle only when
+an assignment round (or the end of the run) needs it.
+"""
+class EventScheduler:
+    def __init__(self, sim):
+        if not hasattr(sim.clock, 'advance'):
+            raise ValueError("The event scheduler needs a headless simulation on a VirtualClock")
+        if sim.fleet:
+            raise ValueError("The event scheduler moves Robot objects, create the simulation without vectorized=True")
+        if sim.planning:
+            raise ValueError("Background planning finishes at wall-clock times, which events cannot reproduce")
+        if sim.reservations:
+            raise ValueError("Cooperative robots are held to their reservations tick by tick, run them with Simulation.run_headless()")
+        if sim.order_source:
+            raise ValueError("Streamed orders are polled every tick, run them with Simulation.run_headless()")
+        self.sim = sim
+        self.clock = sim.clock
+        self.metrics = sim.metrics                  # Same phases as Simulation.tick(), timed per event
+        self.base_tick = sim.elapsed_seconds        # Tick number and clock time the schedule is measured from
+        self.base_ms = sim.clock.get_ticks()
+        self.tick = sim.elapsed_seconds             # Last tick that was run
+        self.events = []                            # Heap of (tick, phase, robot index or sequence, version)
+        self.last = [self.tick] * len(sim.robots)   # Tick each robot's state is up to date with
+        self.version = [0] * len(sim.robots)        # Bumped when a robot is rescheduled, older events are stale
+        self.parked = {}                            # robot index -> tick its idle cycle started
+        self.wait_ticks = -(-WAREHOUSE_WAIT_MS // self.clock.tick_ms)     # Ticks of one warehouse wait
+        self.callbacks = {}                         # sequence -> callback for EXTERNAL events
+        self.sequence = 0
+        self.processed = 0                          # Events run so far
+
+        self._push(self._next_multiple(self.tick + 1, 0), ORDER_ARRIVAL)
+        self._push(self._next_multiple(self.tick + 1, 1), ASSIGNMENT)
+        for i in range(len(sim.robots)):
+            self._schedule(i)
+
+    # First tick >= `tick` that is `remainder` modulo ORDER_PERIOD
+    @staticmethod
+    def _next_multiple(tick, remainder):
+        return tick + (remainder - tick) % ORDER_PERIOD
+
+    def _push(self, tick, phase, key=0, version=0):
+        heapq.heappush(self.events, (tick, phase, key, version))
+
+    def _time(self, tick):
+        return self.base_ms + (tick - self.base_tick) * self.clock.tick_ms
+
+    # Replay the ticks robot i skipped up to `tick`: only its speed delay counter moves in between
+    def _sync(self, i, tick):
+        robot = self.sim.robots[i]
+        if not robot.waiting and not (robot.at_warehouse and not robot.path):
+            delay = int(self.sim.clearance.delay[robot.position])
+            robot.move_delay = min(delay, robot.move_delay + tick - self.last[i])
+        self.last[i] = tick
+
+    # Queue the next tick at which robot i's move() does something observable
+    def _schedule(self, i):
+        robot = self.sim.robots[i]
+        now = self.last[i]
+        if robot.waiting:
+            remaining = robot.wait_start_time + WAREHOUSE_WAIT_MS - self.base_ms
+            tick = max(now + 1, self.base_tick - (-remaining // self.clock.tick_ms))
+        elif robot.at_warehouse and not robot.path:
+            tick = now + 1                          # Starts its wait on the next move
+        else:
+            delay = int(self.sim.clearance.delay[robot.position])
+            tick = now + max(0, delay - robot.move_delay) + 1
+        self.version[i] += 1
+        self._push(tick, ROBOT, i, self.version[i])
+
+    # Set parked robot i's state to what the tick loop would have at the end of `tick`
+    def _unpark_state(self, i, tick):
+        robot = self.sim.robots[i]
+        start = self.parked[i]
+        delay = int(self.sim.clearance.delay[robot.position])
+        period = self.wait_ticks + delay + 1        # Wait, count down the delay, then one move() that finds nothing to do
+        step = (tick - start) % period if tick >= start else period - 1
+        cycle = tick - step
+        robot.waiting = step < self.wait_ticks
+        robot.wait_start_time = self._time(cycle) if robot.waiting else robot.wait_start_time
+        robot.at_warehouse = not (self.wait_ticks <= step < period - 1)
+        robot.move_delay = step - self.wait_ticks + 1 if self.wait_ticks <= step < period - 1 else 0
+        self.last[i] = tick
+
+    # Bring every parked robot up to `tick`, unparking them all if `release`
+    def _update_parked(self, tick, release=False):
+        for i in self.parked:
+            self._unpark_state(i, tick)
+        if release:
+            self.parked.clear()
+
+    # Move the clock to `tick`, first expiring delivered orders as the end of the previous tick would have
+    def _advance(self, tick):
+        if tick == self.tick:
+            return
+        self.clock.now = self._time(tick - 1)
+        with self.metrics.phase('expire'):
+            self.sim.remove_expired_orders()
+        sim = self.sim
+        # Nobody's busy flag changes between events: count the skipped ticks at once
+        sim.sla.fleet_busy(sim.sla.busy_robots, len(sim.robots), tick - self.tick)
+        self.clock.now = self._time(tick)
+        sim.elapsed_seconds = tick
+        self.tick = tick
+        sim.sla.tick(self.clock.now - sim.start_time)
+
+    '''Run `callback()` after the robots have moved on tick `tick`, e.g. to change the map'''
+    def at(self, tick, callback):
+        self.sequence += 1
+        self.callbacks[self.sequence] = callback
+        self._push(tick, EXTERNAL, self.sequence)
+
+    # Run one event; `tick` is already current
+    def _run(self, tick, phase, key, version):
+        sim = self.sim
+        if phase == ROBOT:
+            if version != self.version[key]:
+                return                                  # Rescheduled since
+            self._sync(key, tick - 1)
+            robot = sim.robots[key]
+            with self.metrics.phase('move'):
+                robot.move()
+            self.last[key] = tick
+            if robot.at_warehouse and not robot.path and not robot.waiting and not robot.orders_queue:
+                self.parked[key] = tick + 1                 # Idle: starts waiting on the next tick, then cycles
+            else:
+                self._schedule(key)
+        elif phase == ORDER_ARRIVAL:
+            with self.metrics.phase('orders'):
+                sim.order_arrival()
+            self._push(tick + ORDER_PERIOD, ORDER_ARRIVAL)
+        elif phase == ASSIGNMENT:
+            # Only robots idle at a warehouse can be given orders. Their delay counter does not move while
+            # idle there, so the ones that got orders just need rescheduling from the previous tick
+            self._update_parked(tick - 1)
+            queued = [len(robot.orders_queue) for robot in sim.robots]
+            with self.metrics.phase('assignment'):
+                sim.assign_orders_in_batch()
+            for i, robot in enumerate(sim.robots):
+                if len(robot.orders_queue) != queued[i]:
+                    self.parked.pop(i, None)
+                    self.last[i] = tick - 1
+                    self._schedule(i)
+            self._push(tick + ORDER_PERIOD, ASSIGNMENT)
+        else:
+            # Callbacks may change anything, so every robot is synced before and rescheduled after. They
+            # run after the tick loop's end-of-tick expiry, which decides the order of the free-cell pool
+            self.sim.remove_expired_orders()
+            self._update_parked(tick, release=True)
+            for i in range(len(sim.robots)):
+                self._sync(i, tick)
+            self.callbacks.pop(key)()
+            for i in range(len(sim.robots)):
+                self._schedule(i)
+        self.processed += 1
+
+    '''Run every event up to and including tick `end`, then leave the simulation at that tick'''
+    def run_until(self, end):
+        while self.events and self.events[0][0] <= end:
+            event = heapq.heappop(self.events)
+            self._advance(event[0])
+            self._run(*event)
+        self._advance(end)
+        self.sim.remove_expired_orders()
+        for i in range(len(self.sim.robots)):
+            if i not in self.parked:
+                self._sync(i, end)
+        self._update_parked(end)
+
+    '''Simulate `duration` seconds, like Simulation.run_headless()'''
+    def run(self, duration):
+        ticks = int(-(-duration * 1000 // self.clock.tick_ms))
+        self.run_until(self.base_tick + ticks)
+        return self.sim.get_stats()
@@ -0,0 +1,140 @@
+import numpy as np
+
+WAREHOUSE_WAIT_MS = 1000              # How long an idle robot waits at the warehouse before checking again
+
+
+"""Per-tick state of every robot, kept in NumPy arrays
+
+Positions (flat cell indices), delay counters, wait timers, speed delays and path cursors are
+arrays indexed like `robots`, and paths live back to back in one shared buffer, so a tick moves
+the whole fleet with a handful of vectorized operations. Only robots that reach the end of a leg
+drop back to their Robot object (proceed_to_next_task); to_robots()/from_robots() copy the
+state both ways whenever other code needs the objects up to date.
+"""
+class Fleet:
+    def __init__(self, robots, grid, clearance, clock, warehouses, path_capacity=1024):
+        n = len(robots)
+        self.robots = robots            # Robot objects, for deliveries, order queues and planning
+        self.clock = clock              # Shared time source
+        self.width = grid.shape[1]      # Cells are stored as x * width + y
+        self.delays = clearance.delay.ravel()       # Speed delay per flat cell, a view that follows clearance updates
+        self.warehouses = np.array([x * self.width + y for x, y in warehouses], dtype=np.int64)   # Flat cells of every warehouse
+
+        self.cells = np.zeros(n, dtype=np.int64)            # Current position of every robot
+        self.speed = np.zeros(n, dtype=np.uint8)            # Speed delay (mode) at the current position
+        self.move_delay = np.zeros(n, dtype=np.int32)       # Ticks waited so far before the next move
+        self.waiting = np.zeros(n, dtype=bool)              # Waiting at the warehouse
+        self.wait_start = np.zeros(n, dtype=np.int64)       # When the wait started (ms)
+        self.at_warehouse = np.zeros(n, dtype=bool)
+        self.busy = np.zeros(n, dtype=bool)
+        self.queued = np.zeros(n, dtype=np.int32)           # Orders still in each robot's queue
+
+        self.paths = np.zeros(path_capacity, dtype=np.int64)    # Every remaining path, back to back
+        self.cursor = np.zeros(n, dtype=np.int64)           # Next cell of each robot's path in `paths`
+        self.end = np.zeros(n, dtype=np.int64)              # One past the last cell of each robot's path
+        self.top = 0                                        # First unused slot of `paths`
+        self.from_robots()
+
+    def __len__(self):
+        return len(self.robots)
+
+    # Copy robot i's remaining path to the end of the buffer, compacting it first when full
+    def _write_path(self, i, path):
+        n = len(path)
+        if n == 0:
+            self.cursor[i] = self.end[i] = 0
+            return
+        if self.top + n > len(self.paths):
+            self._compact(n)
+        self.paths[self.top:self.top + n] = [x * self.width + y for x, y in path]
+        self.cursor[i] = self.top
+        self.end[i] = self.top + n
+        self.top += n
+
+    # Gather the unread part of every path to the front of the buffer, growing it to stay at most half full
+    def _compact(self, extra):
+        lengths = self.end - self.cursor
+        total = int(lengths.sum())
+        capacity = len(self.paths)
+        while 2 * (total + extra) > capacity:
+            capacity *= 2
+        starts = np.cumsum(lengths) - lengths
+        gather = np.repeat(self.cursor - starts, lengths) + np.arange(total)
+        paths = np.zeros(capacity, dtype=np.int64)
+        paths[:total] = self.paths[gather]
+        self.paths = paths
+        self.cursor = starts
+        self.end = starts + lengths
+        self.top = total
+
+    '''Write the array state of robots `indices` (all by default) back into their Robot objects'''
+    def to_robots(self, indices=None):
+        for i in range(len(self.robots)) if indices is None else indices:
+            robot = self.robots[i]
+            robot.position = divmod(int(self.cells[i]), self.width)
+            robot.path = [divmod(cell, self.width) for cell in self.paths[self.cursor[i]:self.end[i]].tolist()]
+            robot.move_delay = int(self.move_delay[i])
+            robot.waiting = bool(self.waiting[i])
+            robot.wait_start_time = int(self.wait_start[i]) if robot.waiting else None
+            robot.at_warehouse = bool(self.at_warehouse[i])
+            robot.set_busy(bool(self.busy[i]))
+
+    '''Load robots `indices` (all by default) into the arrays after their objects changed'''
+    def from_robots(self, indices=None):
+        for i in range(len(self.robots)) if indices is None else indices:
+            robot = self.robots[i]
+            x, y = robot.position
+            self.cells[i] = x * self.width + y
+            self.speed[i] = self.delays[self.cells[i]]
+            self.move_delay[i] = robot.move_delay
+            self.waiting[i] = robot.waiting
+            self.wait_start[i] = robot.wait_start_time or 0
+            self.at_warehouse[i] = robot.at_warehouse
+            self.busy[i] = robot.busy
+            self.queued[i] = len(robot.orders_queue)
+            self._write_path(i, robot.path)
+
+    '''Indices of robots idle at the warehouse, ready for new orders'''
+    def idle(self):
+        return np.flatnonzero(self.at_warehouse & ~self.busy).tolist()
+
+    '''Positions of robots `indices` (all by default) as (x, y) tuples'''
+    def positions(self, indices=None):
+        cells = self.cells if indices is None else self.cells[indices]
+        return [divmod(cell, self.width) for cell in cells.tolist()]
+
+    '''Advance every robot by one tick, like calling Robot.move() on each of them'''
+    def step(self):
+        now = self.clock.get_ticks()
+        empty = self.cursor == self.end
+
+        # Idle robots at the warehouse start (or keep) waiting
+        start = self.at_warehouse & empty & ~self.waiting
+        self.waiting |= start
+        self.wait_start[start] = now
+        done = self.waiting & (now - self.wait_start >= WAREHOUSE_WAIT_MS)
+        self.waiting[done] = False
+        self.at_warehouse[done] = False
+
+        # Count down the speed delay, then take one step along the path
+        active = ~self.waiting
+        slow = active & (self.move_delay < self.speed)
+        self.move_delay[slow] += 1
+        go = active & ~slow
+        self.move_delay[go] = 0
+        moving = go & ~empty
+        self.cells[moving] = self.paths[self.cursor[moving]]
+        self.cursor[moving] += 1
+        self.speed[moving] = self.delays[self.cells[moving]]
+
+        # Robots at the end of a leg: idle ones at the warehouse are settled here, the rest by their Robot
+        finished = go & (self.cursor == self.end)
+        home = np.isin(self.cells, self.warehouses)
+        self.busy[finished & home & (self.queued == 0)] = False
+        for i in np.flatnonzero(finished & ~(home & (self.queued == 0))).tolist():
+            self.to_robots((i,))
+            self.robots[i].proceed_to_next_task()
+            self.from_robots((i,))
+            home[i] = self.cells[i] in self.warehouses
+
+        self.at_warehouse |= go & home & (self.queued == 0)
@@ -0,0 +1,113 @@
+import heapq
+from pathfinding import NEIGHBORS, heuristic
+
+INFINITY = float('inf')
+
+
+"""Incremental planner (D* Lite) for one robot and one goal
+
+Distances are kept from the goal backwards, so when cells change only the vertices whose
+distance actually changes are touched again, and the robot can keep moving (move_to) between
+repairs without invalidating anything.
+"""
+class DStarLite:
+    def __init__(self, grid, start, goal):
+        self.grid = grid
+        self.start = start              # Where the robot is now
+        self.goal = goal                # Where it is going
+        self.last = start               # Start at the time of the last repair, for the key modifier
+        self.km = 0                     # Key modifier: heuristic drift since the search began
+        self.g = {}                     # cell -> current distance estimate to the goal
+        self.rhs = {goal: 0}            # cell -> one-step lookahead distance estimate
+        self.open = {goal: self._key(goal)}     # cell -> key it is queued with
+        self.queue = [(self.open[goal], goal)]  # Heap with lazy deletion: entries not matching `open` are stale
+        self.expanded = 0               # Vertices expanded so far, to see how much a repair cost
+        self.compute_shortest_path()
+
+    def _key(self, cell):
+        m = min(self.g.get(cell, INFINITY), self.rhs.get(cell, INFINITY))
+        return (m + heuristic(self.start, cell) + self.km, m)
+
+    def _neighbors(self, cell):
+        h, w = self.grid.shape
+        for i, j in NEIGHBORS:
+            x, y = cell[0] + i, cell[1] + j
+            if 0 <= x < h and 0 <= y < w:
+                yield x, y
+
+    # Moving between two neighboring cells costs 1, or infinity if either is an obstacle
+    def _cost(self, a, b):
+        if self.grid[a] != 0 or self.grid[b] != 0:
+            return INFINITY
+        return 1
+
+    def _update_vertex(self, cell):
+        if cell != self.goal:
+            self.rhs[cell] = min(
+                (self._cost(cell, s) + self.g.get(s, INFINITY) for s in self._neighbors(cell)), default=INFINITY)
+        self.open.pop(cell, None)
+        if self.g.get(cell, INFINITY) != self.rhs.get(cell, INFINITY):
+            key = self._key(cell)
+            self.open[cell] = key
+            heapq.heappush(self.queue, (key, cell))
+
+    def _top(self):
+        while self.queue:
+            key, cell = self.queue[0]
+            if self.open.get(cell) == key:
+                return key, cell
+            heapq.heappop(self.queue)
+        return (INFINITY, INFINITY), None
+
+    def compute_shortest_path(self):
+        while True:
+            key, cell = self._top()
+            start_rhs = self.rhs.get(self.start, INFINITY)
+            if cell is None or (key >= self._key(self.start) and start_rhs == self.g.get(self.start, INFINITY)):
+                return
+            self.expanded += 1
+            new_key = self._key(cell)
+            if key < new_key:
+                self.open[cell] = new_key
+                heapq.heapreplace(self.queue, (new_key, cell))
+                continue
+            heapq.heappop(self.queue)
+            del self.open[cell]
+            if self.g.get(cell, INFINITY) > self.rhs.get(cell, INFINITY):
+                self.g[cell] = self.rhs[cell]
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+            else:
+                self.g[cell] = INFINITY
+                self._update_vertex(cell)
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+
+    '''The robot has moved; keep the existing search and only shift the keys'''
+    def move_to(self, position):
+        self.km += heuristic(self.last, position)
+        self.last = position
+        self.start = position
+
+    '''Repair the distances after `cells` changed in the grid'''
+    def update_cells(self, cells):
+        touched = set()
+        for cell in cells:
+            touched.add(cell)
+            touched.update(self._neighbors(cell))           # Every edge into or out of the cell changed cost
+        for cell in touched:
+            self._update_vertex(cell)
+        self.compute_shortest_path()
+
+    '''Current shortest path from start to goal (both included), or None'''
+    def path(self):
+        if self.g.get(self.start, INFINITY) == INFINITY:
+            return None
+        path = [self.start]
+        cell = self.start
+        while cell != self.goal:
+            cell = min(self._neighbors(cell), key=lambda s: self._cost(cell, s) + self.g.get(s, INFINITY))
+            if self._cost(path[-1], cell) == INFINITY or len(path) > self.grid.size:
+                return None
+            path.append(cell)
+        return path
@@ -0,0 +1,175 @@
+import cProfile
+import contextlib
+import json
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathfinding import search_stats
+
+WINDOW = 100                          # Recent calls of a phase averaged by the live overlay
+SAMPLE_INTERVAL = 0.005               # Seconds between two stacks taken by the sampling profiler
+
+
+"""Wall time and searches of one named phase of the tick, used as a context manager
+
+Searches are counted from pathfinding.search_stats, so a phase is charged for every planner call
+made inside it, however deeply buried (e.g. the path searches in Robot.proceed_to_next_task).
+Searches of the background planning thread land in whichever phase is running at the time.
+"""
+class _Phase:
+    __slots__ = ('count', 'total', 'max', 'recent', 'calls', 'expanded', '_started', '_calls', '_expanded')
+
+    def __init__(self, window):
+        self.count = 0                  # Times the phase ran
+        self.total = 0.0                # Seconds spent in it
+        self.max = 0.0                  # Longest single run, in seconds
+        self.recent = deque(maxlen=window)
+        self.calls = 0                  # Planner searches made inside it
+        self.expanded = 0               # Nodes those searches expanded
+
+    def __enter__(self):
+        self._calls = search_stats.total_calls
+        self._expanded = search_stats.total_expanded
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._started
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.recent.append(elapsed)
+        self.calls += search_stats.total_calls - self._calls
+        self.expanded += search_stats.total_expanded - self._expanded
+        return False
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+"""Per-phase timers and search counters of a simulation run
+
+`with metrics.phase('move'):` times a block; phases may nest (the tick contains the others). When
+disabled, phase() hands back a shared no-op so the instrumented code costs next to nothing.
+"""
+class Instrumentation:
+    def __init__(self, enabled=True, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.phases = {}                            # name -> _Phase, in the order they first ran
+        self.started = time.perf_counter()
+        self.baseline = search_stats.snapshot()     # Searches made before this run are left out of report()
+
+    '''Context manager timing the phase `name`'''
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        timer = self.phases.get(name)
+        if timer is None:
+            timer = self.phases[name] = _Phase(self.window)
+        return timer
+
+    '''Totals so far as a JSON-serializable dict: phases, then searches per planner'''
+    def report(self):
+        planners = {}
+        for name, counts in search_stats.snapshot().items():
+            before = self.baseline.get(name, {'calls': 0, 'expanded': 0})
+            planners[name] = {'calls': counts['calls'] - before['calls'],
+                              'expanded': counts['expanded'] - before['expanded']}
+        return {
+            'wall_seconds': round(time.perf_counter() - self.started, 3),
+            'phases': {
+                name: {
+                    'count': timer.count,
+                    'total_ms': round(timer.total * 1000, 3),
+                    'mean_ms': round(timer.total * 1000 / timer.count, 4) if timer.count else 0,
+                    'max_ms': round(timer.max * 1000, 3),
+                    'planner_calls': timer.calls,
+                    'nodes_expanded': timer.expanded,
+                }
+                for name, timer in self.phases.items()
+            },
+            'planners': planners,
+        }
+
+    '''One line per phase for the live overlay, slowest first: mean and max over the recent calls'''
+    def overlay_lines(self, limit=4):
+        recent = [(sum(timer.recent) / len(timer.recent), max(timer.recent), name, timer)
+                  for name, timer in self.phases.items() if timer.recent]
+        recent.sort(key=lambda entry: entry[0], reverse=True)
+        return [f"{name}: {mean * 1000:.2f} ms (max {peak * 1000:.1f}) | {timer.calls} searches"
+                for mean, peak, name, timer in recent[:limit]]
+
+    '''Write report() plus `extra` fields to `path` as JSON'''
+    def export(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(dict(self.report(), **extra), f, indent=1)
+
+
+"""Statistical profiler: a daemon thread records the stack of one thread every `interval` seconds
+
+Cheaper than cProfile on hot loops and unbiased towards small functions. Stacks are written in the
+collapsed "outer;inner count" format read by flamegraph.pl and speedscope.
+"""
+class StackSampler:
+    def __init__(self, interval=SAMPLE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = Counter()                     # "file:function;..." from the outermost frame -> samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+
+'''Profile the block with cProfile (kind "cprofile", pstats file) or StackSampler (kind "sample", collapsed stacks)'''
+@contextlib.contextmanager
+def profile(kind, path):
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif kind == 'sample':
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            sampler.write(path)
+    else:
+        raise ValueError(f"Unknown profiler {kind!r}, expected 'cprofile' or 'sample'")
@@ -1,19 +1,134 @@
+import argparse
+import contextlib
+
 from map import generate_map
-from simulation import Simulation
-from data import sample_robots
+from mapfile import load_map, parse_cell
+from simulation import Simulation, Robot
+from data import sample_robots, warehouse_location
+from config import WAREHOUSES
+from pathfinding import PLANNERS
+from events import EventScheduler
+from assignment import ASSIGNMENT_MODES
+from instrumentation import profile
+from streaming import FileOrderSource, SocketOrderSource, TraceRecorder
+from sla import EXPORT_INTERVAL_MS
 
 if __name__ == '__main__':
-    campus_map, _ = generate_map() # Returns a representation of the environment
+    parser = argparse.ArgumentParser(description="FOODIE campus delivery simulation")
+    parser.add_argument('--headless', type=float, metavar='SECONDS',
+                        help="Simulate this many seconds without a window and print the stats")
+    parser.add_argument('--planner', default='astar', choices=sorted(PLANNERS),
+                        help="Pathfinding used by the robots")
+    parser.add_argument('--robots', type=int, metavar='N',
+                        help="Run N robots instead of the three sample robots")
+    parser.add_argument('--vectorized', action='store_true',
+                        help="Move the whole fleet with NumPy arrays (for large fleets)")
+    parser.add_argument('--background-planning', action='store_true',
+                        help="Plan assignments and replans on a worker thread so the window never waits for them")
+    parser.add_argument('--assignment', default='greedy', choices=ASSIGNMENT_MODES,
+                        help="Give batches to robots in list order, or by min-cost matching")
+    parser.add_argument('--assignment-workers', type=int, default=0, metavar='N',
+                        help="Route assignment batches in N worker processes")
+    parser.add_argument('--seed', type=int,
+                        help="Seed the map and the orders so the run can be reproduced")
+    parser.add_argument('--map', metavar='PATH',
+                        help="Load a map saved with mapfile.py (and its precomputed tables) instead of generating one")
+    parser.add_argument('--warehouses', type=parse_cell, nargs='+', metavar='X,Y',
+                        help="Warehouse cells; robots start spread over them and return to the nearest one")
+    parser.add_argument('--cooperative', action='store_true',
+                        help="Plan paths against space-time reservations so no two robots ever share a cell")
+    parser.add_argument('--events', action='store_true',
+                        help="With --headless, jump from event to event instead of running every tick")
+    parser.add_argument('--instrument', action='store_true',
+                        help="Time every phase of the tick and count searches, shown under the stats panel")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Write the phase timers and search counters as JSON at the end of the run (implies --instrument)")
+    parser.add_argument('--sla', metavar='PATH',
+                        help="Log wait, assignment and delivery latency percentiles and fleet utilization to a JSONL file")
+    parser.add_argument('--sla-interval', type=float, default=EXPORT_INTERVAL_MS / 1000, metavar='SECONDS',
+                        help="Simulated time between two lines of the --sla log (default: %(default)s)")
+    parser.add_argument('--profile', choices=('cprofile', 'sample'),
+                        help="Profile the run with cProfile or with a stack sampler")
+    parser.add_argument('--profile-out', metavar='PATH',
+                        help="Profile output (default: foodie.prof for cprofile, foodie.stacks for sample)")
+    parser.add_argument('--orders', metavar='PATH',
+                        help="Replay timestamped orders from a JSONL file or a recorded trace instead of random ones")
+    parser.add_argument('--orders-port', type=int, metavar='PORT',
+                        help="Take timestamped JSONL orders from clients of this local TCP port instead of random ones")
+    parser.add_argument('--record', metavar='PATH',
+                        help="Write every order and assignment to a JSONL trace (.gz to compress) for replay with --orders")
+    args = parser.parse_args()
+    if args.orders and args.orders_port is not None:
+        parser.error("--orders and --orders-port are alternative order sources, pick one")
+    if args.cooperative and (args.vectorized or args.background_planning or args.events):
+        parser.error("--cooperative runs Robot objects tick by tick, without --vectorized, --background-planning or --events")
+    if args.background_planning and args.assignment_workers:
+        parser.error("--background-planning plans assignment rounds on its own worker thread, drop --assignment-workers")
+    if args.assignment_workers < 0:
+        parser.error("--assignment-workers must be 0 (route in the simulation process) or more")
+    if args.sla_interval <= 0:
+        parser.error("--sla-interval must be positive")
+    if args.events and (args.orders or args.orders_port is not None):
+        parser.error("streamed orders are polled every tick and cannot be run with --events")
+    if args.events and args.headless is None:
+        parser.error("--events skips idle ticks of a headless run, add --headless SECONDS")
+    if args.events and (args.vectorized or args.background_planning):
+        parser.error("--events moves Robot objects at event times, without --vectorized or --background-planning")
+
+    tables = None
+    if args.map:
+        tables = load_map(args.map)
+        warehouses = args.warehouses or tables.warehouses
+        campus_map = tables.grid
+    else:
+        warehouses = args.warehouses or WAREHOUSES
+        campus_map, _ = generate_map(seed=args.seed, warehouses=warehouses) # Returns a representation of the environment
+    for warehouse in warehouses:
+        if not (0 <= warehouse[0] < campus_map.shape[0] and 0 <= warehouse[1] < campus_map.shape[1]) or campus_map[warehouse]:
+            parser.error(f"warehouse {warehouse} is not a free cell of the map")
+
+    robots = sample_robots
+    if args.robots is not None or warehouse_location not in warehouses:
+        # Spread the robots over the warehouses
+        count = len(sample_robots) if args.robots is None else args.robots
+        robots = [Robot(f'R{i + 1}', warehouses[i % len(warehouses)]) for i in range(count)]
+
+    order_source = None
+    if args.orders:
+        order_source = FileOrderSource(args.orders)
+    elif args.orders_port is not None:
+        order_source = SocketOrderSource(args.orders_port)
+        print(f"[INFO] Listening for orders on 127.0.0.1:{order_source.port}")
 
     # Initialize and start the simulation with the map, orders, and robots
-    sim = Simulation(campus_map, [], sample_robots)
+    sim = Simulation(campus_map, [], robots, headless=args.headless is not None,
+                     planner=args.planner, vectorized=args.vectorized,
+                     background_planning=args.background_planning,
+                     assignment_workers=args.assignment_workers, assignment=args.assignment, seed=args.seed,
+                     instrument=args.instrument, metrics_path=args.metrics, order_source=order_source,
+                     trace=TraceRecorder(args.record) if args.record else None, tables=tables,
+                     warehouses=warehouses, cooperative=args.cooperative,
+                     sla_path=args.sla, sla_interval=int(args.sla_interval * 1000))
 
-    # Pre-fill with 12 orders
-    for _ in range(12):
-        new_order = sim.generate_order()
-        new_order['order_id'] = sim.order_id_counter
-        sim.orders.append(new_order)
-        sim.order_id_counter += 1
+    if order_source:
+        sim.ingest_orders()     # Orders due at the start take the place of the pre-fill
+    else:
+        # Pre-fill with 12 orders
+        sim.create_orders(12)
 
     sim.assign_orders_in_batch()
-    sim.run() # Launches the visual simulation using Pygame
+    profiling = contextlib.nullcontext()
+    if args.profile:
+        profiling = profile(args.profile, args.profile_out or ('foodie.prof' if args.profile == 'cprofile' else 'foodie.stacks'))
+    with profiling:
+        if args.headless is not None:
+            if args.events:
+                EventScheduler(sim).run(args.headless)  # Same outcomes, but idle ticks are skipped
+            else:
+                sim.run_headless(args.headless) # Runs the same logic on a virtual clock, as fast as possible
+            sim.print_stats()
+            if args.metrics:
+                sim.export_metrics(args.metrics)
+            sim.close()
+        else:
+            sim.run() # Launches the visual simulation using Pygame
@@ -1,19 +1,19 @@
 import numpy as np
-import random
-from config import  MAP_SIZE, OBSTACLE_RATIO, FW_LOCATION
+from config import  MAP_SIZE, OBSTACLE_RATIO, WAREHOUSES
 
 
-def generate_map(size=MAP_SIZE, obstacle_ratio=OBSTACLE_RATIO):
-    grid = np.zeros((size, size), dtype=int) # Creates a 2D numpy array filled with zeros
-    num_obstacles = int(size * size * obstacle_ratio) # Determines how many obstacles to place based on the ratio
-    obstacles = set()
-    
-    # Random Obstacle Placement:
-    while len(obstacles) < num_obstacles:
-        x, y = random.randint(0, size - 1), random.randint(0, size - 1)
-        # Avoiding the warehouse
-        if (x, y) != FW_LOCATION:
-            obstacles.add((x, y))
-            grid[x, y] = 1
+def generate_map(size=MAP_SIZE, obstacle_ratio=OBSTACLE_RATIO, seed=None, warehouses=WAREHOUSES):
+    rng = np.random.default_rng(seed)   # Same seed, same map
+    cells = size * size
+    grid = np.zeros((size, size), dtype=np.uint8) # Creates a 2D numpy array filled with zeros, one byte per cell
 
-    return grid, obstacles
\ No newline at end of file
+    # Random Obstacle Placement: distinct cells drawn in one call, avoiding the warehouses
+    kept = np.unique([x * size + y for x, y in warehouses if max(x, y) < size]).astype(np.int64)
+    candidates = cells - len(kept)
+    num_obstacles = min(int(cells * obstacle_ratio), candidates) # Determines how many obstacles to place based on the ratio
+    picked = rng.choice(candidates, num_obstacles, replace=False)
+    picked += np.searchsorted(kept - np.arange(len(kept)), picked, side='right')    # Skip over the warehouses' flat indices
+    grid.flat[picked] = 1
+
+    obstacles = set(zip(*(axis.tolist() for axis in np.nonzero(grid))))
+    return grid, obstacles
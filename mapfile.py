@@ -0,0 +1,164 @@
+"""Versioned on-disk maps with precomputed tables, loaded with np.memmap
+
+A map file holds the occupancy grid and, optionally, tables derived from it: distance fields from
+chosen sources (the warehouses by default), the nearest-warehouse tables, the clearance map and the
+HPA* cluster graph. Loading
+maps the arrays straight from the file, so a big campus map starts without regenerating or
+recomputing anything, and every process that loads the same file shares one copy in the page cache.
+The grid and clearance arrays are mapped copy-on-write: map changes made by a simulation stay private.
+
+Layout: 8-byte magic, format version and header length (little-endian uint32), a JSON header listing
+the sections (name, dtype, shape, offset), then each section at an ALIGNMENT-byte boundary.
+
+    python mapfile.py campus.map --size 512 --obstacle-ratio 0.2 --seed 7
+    python main.py --map campus.map
+"""
+import argparse
+import json
+import struct
+import numpy as np
+
+from config import MAP_SIZE, OBSTACLE_RATIO, WAREHOUSES
+from map import generate_map
+from distance import distance_field, nearest_source_field
+from clearance import ClearanceMap
+import hierarchical
+
+MAGIC = b'FOODMAP\0'
+FORMAT_VERSION = 3                    # 2: several warehouses and their nearest-warehouse tables; 3: HPA* graph as an array
+ALIGNMENT = 64                        # Sections start on cache-line boundaries
+_PREFIX = struct.Struct('<8sII')      # magic, format version, header length
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+'''Write `grid` and its precomputed tables to `path`
+
+`sources` are the cells whose distance fields are stored (every warehouse by default); `packed` stores the occupancy as one bit
+per cell (8x smaller, but then it is unpacked into memory on load instead of being mapped).
+'''
+def save_map(path, grid, warehouses=WAREHOUSES, sources=None, clearance=True, clusters=True, packed=False):
+    warehouses = [tuple(warehouse) for warehouse in warehouses]
+    sources = warehouses if sources is None else [tuple(source) for source in sources]
+    occupancy = np.packbits(grid != 0, axis=1) if packed else (grid != 0).astype(np.uint8)
+    sections = [({'name': 'occupancy', 'packed': packed}, occupancy)]
+    distance, index = nearest_source_field(grid, warehouses)
+    sections.append(({'name': 'nearest_distance'}, distance))
+    sections.append(({'name': 'nearest_warehouse'}, index))
+    for source in sources:
+        sections.append(({'name': 'distance', 'source': list(source)}, distance_field(grid, source)))
+    if clearance:
+        table = ClearanceMap(grid)
+        sections.append(({'name': 'clearance_distance'}, table.distance))
+        sections.append(({'name': 'clearance_delay'}, table.delay))
+    if clusters:
+        sections.append(({'name': 'clusters', 'cluster_size': hierarchical.CLUSTER_SIZE}, hierarchical.graph_table(grid)))
+
+    offset = 0
+    for entry, array in sections:
+        entry.update(dtype=array.dtype.str, shape=list(array.shape), offset=offset)     # Relative to the data start
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({'shape': list(grid.shape), 'warehouses': [list(warehouse) for warehouse in warehouses],
+                         'sections': [entry for entry, _ in sections]}).encode()
+    data_start = _align(_PREFIX.size + len(header))
+    with open(path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for entry, array in sections:
+            f.seek(data_start + entry['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+"""A map file opened for use: the grid plus whichever precomputed tables it holds"""
+class MapFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a FOODIE map file")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has map format version {version}, this build reads version {FORMAT_VERSION}")
+            header = json.loads(f.read(length))
+        self.data_start = _align(_PREFIX.size + length)
+        self.shape = tuple(header['shape'])
+        self.warehouses = [tuple(warehouse) for warehouse in header['warehouses']]
+        self.sections = header['sections']
+        occupancy = next(entry for entry in self.sections if entry['name'] == 'occupancy')
+        if occupancy['packed']:
+            self.grid = np.unpackbits(np.asarray(self._map(occupancy)), axis=1, count=self.shape[1])
+        else:
+            self.grid = self._map(occupancy, mode='c')          # Private copy of a page only when a cell changes
+
+    def _map(self, entry, mode='r'):
+        if 0 in entry['shape']:
+            return np.empty(entry['shape'], dtype=np.dtype(entry['dtype']))    # Nothing to map (e.g. no HPA* edges)
+        return np.memmap(self.path, dtype=np.dtype(entry['dtype']), mode=mode,
+                         offset=self.data_start + entry['offset'], shape=tuple(entry['shape']))
+
+    def _section(self, name):
+        return next((entry for entry in self.sections if entry['name'] == name), None)
+
+    '''Stored distance fields as {source: read-only array}'''
+    def fields(self):
+        return {tuple(entry['source']): self._map(entry) for entry in self.sections if entry['name'] == 'distance'}
+
+    '''Stored (distance, index) nearest-warehouse tables if they were made for `warehouses`, else None'''
+    def nearest_tables(self, warehouses):
+        distance, index = self._section('nearest_distance'), self._section('nearest_warehouse')
+        if distance is None or index is None or [tuple(w) for w in warehouses] != self.warehouses:
+            return None
+        return self._map(distance), self._map(index)
+
+    '''ClearanceMap over the stored tables (patched copy-on-write), or None if they were not saved'''
+    def clearance_map(self):
+        distance, delay = self._section('clearance_distance'), self._section('clearance_delay')
+        if distance is None or delay is None:
+            return None
+        return ClearanceMap.from_arrays(self.grid, self._map(distance, mode='c'), self._map(delay, mode='c'))
+
+    '''Hand the stored distance fields to `distances` and, with `clusters`, the stored cluster graph to the HPA* planner of the grid'''
+    def preload(self, distances, clusters=True):
+        for source, field in self.fields().items():
+            distances.preload(source, field)
+        clusters = self._section('clusters') if clusters else None
+        if clusters is not None:
+            hierarchical.restore_planner(self.grid, self._map(clusters), clusters['cluster_size'])
+
+
+'''Parse an "X,Y" command-line cell'''
+def parse_cell(text):
+    try:
+        x, y = (int(part) for part in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a cell as X,Y, got {text!r}")
+    return x, y
+
+
+'''Open a map file written by save_map()'''
+def load_map(path):
+    return MapFile(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a FOODIE map and save it with its precomputed tables")
+    parser.add_argument('path')
+    parser.add_argument('--size', type=int, default=MAP_SIZE)
+    parser.add_argument('--obstacle-ratio', type=float, default=OBSTACLE_RATIO)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--warehouses', type=parse_cell, nargs='+', metavar='X,Y',
+                        help=f"Warehouse cells (default: {' '.join(f'{x},{y}' for x, y in WAREHOUSES)})")
+    parser.add_argument('--packed', action='store_true', help="Store one bit per cell instead of one byte")
+    parser.add_argument('--no-clearance', action='store_true', help="Leave out the clearance map")
+    parser.add_argument('--no-clusters', action='store_true', help="Leave out the HPA* cluster graph")
+    args = parser.parse_args()
+
+    warehouses = args.warehouses or WAREHOUSES
+    outside = [warehouse for warehouse in warehouses if max(warehouse) >= args.size]
+    if outside:
+        parser.error(f"the map size must be larger than {max(outside[0])} to hold the warehouse at {outside[0]}")
+    grid, _ = generate_map(args.size, args.obstacle_ratio, seed=args.seed, warehouses=warehouses)
+    save_map(args.path, grid, warehouses, clearance=not args.no_clearance, clusters=not args.no_clusters, packed=args.packed)
+    print(f"[INFO] Saved a {args.size}x{args.size} map to {args.path}")
@@ -0,0 +1,101 @@
+from collections import deque
+import numpy as np
+from spatial import SpatialIndex
+
+DELIVERED_DISPLAY_MS = 2000           # How long a delivered order stays on the map (shown in green)
+
+
+"""One delivery order
+
+"""
+class Order:
+    __slots__ = ('order_id', 'location', 'assigned', 'delivered', 'created_time', 'delivered_time',
+                 'warehouse_distance')
+
+    def __init__(self, order_id, location, created_time):
+        self.order_id = order_id        # ID                                               ex: 1
+        self.location = location        # Delivery cell                                    ex: (0, 3)
+        self.assigned = False           # Whether a robot has taken the order
+        self.delivered = False          # Whether the order has been delivered
+        self.created_time = created_time    # Timestamp when the order was placed (ms)
+        self.delivered_time = None      # Timestamp when the order was delivered (ms)
+        self.warehouse_distance = None  # Straight-line distance to its nearest warehouse, set by the simulation
+
+    def __repr__(self):
+        return f"Order({self.order_id}, {self.location})"
+
+
+"""All active orders, indexed by lifecycle state
+
+Orders move unassigned -> assigned -> delivered in O(1), and delivered orders are expired in bulk
+(oldest first) once they have been displayed long enough.
+"""
+class OrderStore:
+    def __init__(self, grid, orders=(), warehouses=1):
+        self.orders = {}                # order_id -> Order, for every order still on the map
+        self.unassigned = {}            # order_id -> Order, in creation order
+        self.assigned = {}              # order_id -> Order, taken by a robot but not delivered yet
+        self.delivered = deque()        # Delivered orders in delivery order, expired from the left
+        self.index = SpatialIndex()     # Unassigned orders by bucket, every order by location
+        self.active_count = 0           # Orders not delivered yet
+        self.free_cells = int(grid.size - np.count_nonzero(grid)) - warehouses    # Cells that can hold an order (minus the warehouses)
+        self.metrics = None             # sla.ServiceMetrics told about every assignment and delivery, if any
+        for order in orders:
+            self.add(order)
+
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def __len__(self):
+        return len(self.orders)
+
+    '''Whether an order is already placed on `location`'''
+    def is_occupied(self, location):
+        return location in self.index
+
+    '''Add a new order'''
+    def add(self, order):
+        self.orders[order.order_id] = order
+        self.index.add(order)
+        if order.delivered:
+            self.delivered.append(order)
+            return
+        self.active_count += 1
+        if order.assigned:
+            self.assigned[order.order_id] = order
+        else:
+            self.unassigned[order.order_id] = order
+
+    '''A robot has taken the order (at `now` ms, recorded as its wait if given)'''
+    def mark_assigned(self, order, now=None):
+        order.assigned = True
+        if self.unassigned.pop(order.order_id, None) is not None:
+            self.assigned[order.order_id] = order
+            if self.metrics and now is not None:
+                self.metrics.order_assigned(order, now)
+        self.index.mark_assigned(order)
+
+    '''The order has reached its customer'''
+    def mark_delivered(self, order, now):
+        order.delivered = True
+        order.delivered_time = now
+        if self.assigned.pop(order.order_id, None) is not None or self.unassigned.pop(order.order_id, None) is not None:
+            self.active_count -= 1
+            self.delivered.append(order)
+            if self.metrics:
+                self.metrics.order_delivered(order, now)
+        self.index.mark_assigned(order)
+
+    '''Remove delivered orders older than `ttl` ms and return them'''
+    def expire_delivered(self, now, ttl=DELIVERED_DISPLAY_MS):
+        expired = []
+        while self.delivered and now - self.delivered[0].delivered_time > ttl:
+            order = self.delivered.popleft()
+            del self.orders[order.order_id]
+            self.index.remove(order)
+            expired.append(order)
+        return expired
+
+    '''Keep the free-cell count in sync when a cell becomes blocked (or free again)'''
+    def obstacle_changed(self, blocked):
+        self.free_cells += -1 if blocked else 1
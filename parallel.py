@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import numpy as np
+from distance import DistanceOracle
+from assignment import group_orders, pair_groups, route_stops, make_batch, MAX_ORDERS_PER_ROBOT, GROUP_RADIUS
+
+_worker = {}                          # Per-process state of a pool worker: shared grid, its version and distance fields
+
+
+def _init_worker(name, shape, optimizer):
+    shm = shared_memory.SharedMemory(name=name)
+    grid = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    _worker.update(shm=shm, grid=grid, version=0, distances=DistanceOracle(grid), optimizer=optimizer)
+
+
+# Route one group in a worker; the grid is read from shared memory, never pickled
+def _route_task(version, start, locations):
+    if version != _worker['version']:                   # The map changed since the last round
+        _worker['distances'].invalidate()
+        _worker['version'] = version
+    return route_stops(_worker['distances'], start, locations, _worker['optimizer'])
+
+
+"""Scores the batches of an assignment round in a process pool
+
+Building the groups is cheap and has to be sequential (each group takes orders away from the next),
+so it stays in the simulation process. Routing each group from its robot (distance fields, exact or
+heuristic ordering, paths) is the expensive part and runs in the workers, which read the map from
+shared memory and keep their own distance fields. Results are merged back in robot order, so a
+round gives exactly the batches the serial plan_batches() would.
+"""
+class ParallelPlanner:
+    def __init__(self, grid, workers=None, optimizer='auto'):
+        self.workers = workers or os.cpu_count()
+        self.shm = shared_memory.SharedMemory(create=True, size=grid.size)
+        self.grid = np.ndarray(grid.shape, dtype=np.uint8, buffer=self.shm.buf)    # Workers see writes to this array
+        self.grid[:] = grid != 0
+        self.version = 0                                # Bumped on every map change; workers drop their fields when it moves
+        try:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.shm.name, grid.shape, optimizer))
+        except BaseException:
+            self.grid = None                            # The workers need the segment's name, so it exists first: free it
+            self.shm.close()
+            self.shm.unlink()
+            raise
+
+    '''Mirror map changes {cell: blocked}; only call it between rounds'''
+    def update_cells(self, changes):
+        for cell, blocked in changes.items():
+            self.grid[cell] = 1 if blocked else 0
+        self.version += 1
+
+    '''Same as assignment.plan_batches, with the routing spread over the pool
+
+    `distances` are the simulation's own fields, only used to pair groups with robots in "optimal" mode.
+    '''
+    def plan_batches(self, unassigned, robots, now, distances, max_orders=MAX_ORDERS_PER_ROBOT,
+                     radius=GROUP_RADIUS, mode='greedy', index=None):
+        groups = group_orders(unassigned, len(robots), now, max_orders, radius, index)
+        pairs = pair_groups(groups, robots, distances, mode)
+        chunksize = max(1, len(pairs) // (4 * self.workers))
+        routes = self.pool.map(_route_task, [self.version] * len(pairs), [position for _, position, _ in pairs],
+                               [[order.location for order in group] for _, _, group in pairs], chunksize=chunksize)
+        return [make_batch(key, position, group, route, paths)
+                for (key, position, group), (route, paths) in zip(pairs, routes)]
+
+    '''Stop the workers and free the shared map'''
+    def close(self):
+        self.pool.shutdown()
+        self.grid = None
+        self.shm.close()
+        self.shm.unlink()
@@ -1,52 +1,225 @@
 import heapq
+import threading
 import numpy as np
+from array import array
 from collections import deque
-import heapq
 
+NEIGHBORS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+DIAGONAL_COST = 1                     # Every move, straight or diagonal, costs one step
 
-# The “h” score is calculated by Euclidean distance instead of Manhattan distance.
+
+# The “h” score is the octile distance; with diagonal moves costing the same as straight ones it is the
+# Chebyshev distance, which never overestimates, so A* returns shortest paths.
 def heuristic(a, b):
-    return np.sqrt(((b[0] - a[0] )**2)+((b[1]-a[1])**2))
+    dx, dy = abs(b[0] - a[0]), abs(b[1] - a[1])
+    return max(dx, dy) + (DIAGONAL_COST - 1) * min(dx, dy)
+
+
+"""Preallocated search buffers for one grid
+
+Cells are flat indices into the grid padded with a ring of obstacles, so neighbors are fixed
+offsets and need no bounds checks. Buffers are reused between searches through generation
+counters instead of being cleared: a cell's `stamp` packs the generation that last reached it with
+its g-score (newer generation or smaller g = larger stamp), and obstacles hold a stamp no search
+can beat, so one comparison tells whether a neighbor is open and improvable. When cells change,
+only their entries are patched (see grid_changed()).
+"""
+class _SearchBuffers:
+    def __init__(self, grid, epoch):
+        h, w = grid.shape
+        self.epoch = epoch                                      # grid_changed() count this was built for
+        self.width = w + 2
+        size = (h + 2) * self.width
+        self.size = size
+        self.offsets = [i * self.width + j for i, j in NEIGHBORS]
+        self.rows, self.cols = _coordinates(grid.shape)         # Padded coordinates of every flat index, shared
+        blocked = np.pad(grid != 0, 1, constant_values=True).ravel()
+        self.blocked = bytearray(blocked.tobytes())             # 1 for obstacles and the padding ring
+        self.stamp = array('q', np.where(blocked, _BLOCKED, 0).astype(np.int64).tobytes())
+        self.parent = array('q', bytes(size * 8))
+        self.closed = array('q', bytes(size * 8))
+        self.generation = 0
+
+    def next_generation(self):
+        self.generation += 1
+        return self.generation
+
+    # Bring the obstacle entries of `cells` up to date with `grid`
+    def patch(self, grid, cells, epoch):
+        for x, y in cells:
+            n = (x + 1) * self.width + y + 1
+            blocked = int(grid[x, y] != 0)
+            self.blocked[n] = blocked
+            self.stamp[n] = _BLOCKED if blocked else 0
+        self.epoch = epoch
+
+
+_BLOCKED = 2 ** 63 - 1
+_CHANGE_LOG = 64                        # grid_changed() calls remembered per grid; older buffers are rebuilt
+_buffers = threading.local()            # Buffers are per thread so background planners can search concurrently
+_grid_epochs = {}                       # id(grid) -> number of grid_changed() calls
+_grid_changes = {}                      # id(grid) -> [(epoch, cells or None)] for the last few grid_changed() calls
+_coordinate_cache = {}                  # Padded grid shape -> (rows, cols) of every flat index
+
+
+def _coordinates(shape):
+    coordinates = _coordinate_cache.get(shape)
+    if coordinates is None:
+        if len(_coordinate_cache) >= 16:
+            _coordinate_cache.clear()
+        rows, cols = np.divmod(np.arange((shape[0] + 2) * (shape[1] + 2)), shape[1] + 2)
+        coordinates = _coordinate_cache[shape] = (rows.tolist(), cols.tolist())
+    return coordinates
+
+
+# Cells changed in `grid` since grid_changed() count `epoch`, or None if they are not all known
+def _changes_since(grid, epoch):
+    changes = _grid_changes.get(id(grid), ())
+    if not changes or changes[0][0] > epoch + 1:
+        return None
+    cells = []
+    for changed_at, changed in changes:
+        if changed_at > epoch:
+            if changed is None:
+                return None
+            cells.extend(changed)
+    return cells
+
+
+def _search_buffers(grid):
+    cache = getattr(_buffers, 'by_grid', None)
+    if cache is None:
+        cache = _buffers.by_grid = {}
+    epoch = _grid_epochs.get(id(grid), 0)
+    cached = cache.get(id(grid))
+    if cached is not None and cached[0] is grid:
+        if cached[1].epoch == epoch:
+            return cached[1]
+        cells = _changes_since(grid, cached[1].epoch)
+        if cells is not None:
+            cached[1].patch(grid, cells, epoch)
+            return cached[1]
+    if len(cache) >= 16:
+        cache.clear()
+    buffers = _SearchBuffers(grid, epoch)
+    cache[id(grid)] = (grid, buffers)
+    return buffers
+
+
+# Must be called after cells of `grid` change, so searches stop using the cached obstacle layout.
+# With the changed `cells`, cached buffers only patch those; without, they are rebuilt.
+def grid_changed(grid, cells=None):
+    epoch = _grid_epochs[id(grid)] = _grid_epochs.get(id(grid), 0) + 1
+    changes = _grid_changes.setdefault(id(grid), [])
+    changes.append((epoch, None if cells is None else list(cells)))
+    del changes[:-_CHANGE_LOG]
+
+
+# Number of grid_changed() calls for `grid`, for other caches built from it.
+def grid_epoch(grid):
+    return _grid_epochs.get(id(grid), 0)
+
+
+"""Running totals of the searches made by each planner: calls and nodes expanded
+
+Planners record once per search, so the counting costs one local increment per expanded node.
+Read it for benchmarks and instrumentation; reset() starts a new measurement.
+"""
+class SearchStats:
+    def __init__(self):
+        self.lock = threading.Lock()            # Background planners record from their own threads
+        self.calls = {}                         # planner name -> searches
+        self.expanded = {}                      # planner name -> nodes taken off the open list and expanded
+        self.total_calls = 0                    # Both totals over every planner, cheap to read between phases
+        self.total_expanded = 0
+
+    def record(self, planner, expanded):
+        with self.lock:
+            self.calls[planner] = self.calls.get(planner, 0) + 1
+            self.expanded[planner] = self.expanded.get(planner, 0) + expanded
+            self.total_calls += 1
+            self.total_expanded += expanded
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.expanded.clear()
+            self.total_calls = self.total_expanded = 0
+
+    '''{planner: {"calls": n, "expanded": n}} for every planner used since the last reset()'''
+    def snapshot(self):
+        with self.lock:
+            return {name: {'calls': calls, 'expanded': self.expanded[name]} for name, calls in self.calls.items()}
+
+
+search_stats = SearchStats()
+
+
 # Improving Robot Direction movability : The agent can move horizontally and vertically, but also diagonally.
 def astar(grid, start, goal):
-    neighbors = [(-1, 0), (1, 0), (0, -1), (0, 1),(-1,-1),(1,-1),(-1,1),(1,1)]
-    close_set = set()
-    came_from = {}
-    gscore = {start: 0}
-    fscore = {start: heuristic(start, goal)}
-    oheap = []
-
-    heapq.heappush(oheap, (fscore[start], start))
+    buffers = _search_buffers(grid)
+    width, size, stamp = buffers.width, buffers.size, buffers.stamp
+    generation = buffers.next_generation()
+    base = generation * size + size - 1                         # stamp = base - g for cells reached in this search
+    source = (start[0] + 1) * width + start[1] + 1
+    target = (goal[0] + 1) * width + goal[1] + 1
+    source_stamp = stamp[source]                                # Restored afterwards in case the start is an obstacle
+    stamp[source] = base
+    try:
+        return _astar_search(buffers, generation, base, source, target, start, goal)
+    finally:
+        if source_stamp == _BLOCKED:
+            stamp[source] = _BLOCKED
+
+
+def _astar_search(buffers, generation, base, source, target, start, goal):
+    width, size = buffers.width, buffers.size
+    rows, cols, offsets = buffers.rows, buffers.cols, buffers.offsets
+    stamp, parent, closed = buffers.stamp, buffers.parent, buffers.closed
+    goal_row, goal_col = goal[0] + 1, goal[1] + 1
+    diagonal_extra = DIAGONAL_COST - 1
+
+    # Heap entries pack (f, -g, min(dx, dy), cell) into one int: ties on f prefer the deeper node,
+    # then the one closer to the straight line towards the goal
+    oheap = [heuristic(start, goal) * size * width * size + (size - 1) * width * size + source]
+    expanded = 0
 
     while oheap:
-        _, current = heapq.heappop(oheap)
-        if current == goal:
+        current = heapq.heappop(oheap) % size
+        if current == target:
+            search_stats.record('astar', expanded)
             data = []
-            while current in came_from:
-                data.append(current)
-                current = came_from[current]
+            while current != source:
+                data.append((rows[current] - 1, cols[current] - 1))
+                current = parent[current]
             data.append(start)
             return data[::-1]
 
-        close_set.add(current)
-        for i, j in neighbors:
-            neighbor = current[0] + i, current[1] + j
-            tentative_g_score = gscore[current] + 1
-            if 0 <= neighbor[0] < grid.shape[0] and 0 <= neighbor[1] < grid.shape[1]:
-                if grid[neighbor[0]][neighbor[1]] == 1:
-                    continue
-            else:
-                continue
-
-            if neighbor in close_set and tentative_g_score >= gscore.get(neighbor, 0):
-                continue
-
-            if tentative_g_score < gscore.get(neighbor, float('inf')):
-                came_from[neighbor] = current
-                gscore[neighbor] = tentative_g_score
-                fscore[neighbor] = tentative_g_score + heuristic(neighbor, goal)
-                heapq.heappush(oheap, (fscore[neighbor], neighbor))
-
+        if closed[current] == generation:
+            continue
+        closed[current] = generation
+        expanded += 1
+        tentative_g_score = base - stamp[current] + 1
+        tentative_stamp = base - tentative_g_score
+        depth_key = size - 1 - tentative_g_score
+
+        # The heuristic is consistent, so closed cells never have a larger g-score and need no extra check
+        for offset in offsets:
+            neighbor = current + offset
+            if tentative_stamp > stamp[neighbor]:
+                stamp[neighbor] = tentative_stamp
+                parent[neighbor] = current
+                dx = abs(rows[neighbor] - goal_row)
+                dy = abs(cols[neighbor] - goal_col)
+                if dx > dy:
+                    h, tie = dx + diagonal_extra * dy, dy
+                else:
+                    h, tie = dy + diagonal_extra * dx, dx
+                heapq.heappush(oheap, (((tentative_g_score + h) * size + depth_key) * width + tie) * size + neighbor)
+
+    search_stats.record('astar', expanded)
     return None
 
 
@@ -59,6 +232,7 @@ def dfs(grid, start, goal):
         current, path = stack.pop()
 
         if current == goal:
+            search_stats.record('dfs', len(visited))
             return path
 
         if current in visited:
@@ -74,6 +248,7 @@ def dfs(grid, start, goal):
                 neighbor not in visited):
                 stack.append((neighbor, path + [neighbor]))
 
+    search_stats.record('dfs', len(visited))
     return None  # No path found
 
 
@@ -85,11 +260,13 @@ def bfs(grid, start, goal):
 
     queue.append(start)
     visited.add(start)
+    expanded = 0
 
     while queue:
         current = queue.popleft()
 
         if current == goal:
+            search_stats.record('bfs', expanded)
             # Reconstruct path
             path = []
             while current in came_from:
@@ -98,6 +275,7 @@ def bfs(grid, start, goal):
             path.append(start)
             return path[::-1]
 
+        expanded += 1
         for i, j in neighbors:
             neighbor = current[0] + i, current[1] + j
 
@@ -110,6 +288,7 @@ def bfs(grid, start, goal):
                 visited.add(neighbor)
                 came_from[neighbor] = current
 
+    search_stats.record('bfs', expanded)
     return None  # No path found
 
 
@@ -125,6 +304,7 @@ def dijkstra(grid, start, goal):
         current_cost, current = heapq.heappop(min_heap)
 
         if current == goal:
+            search_stats.record('dijkstra', len(visited))
             # Reconstruct path
             path = []
             while current in came_from:
@@ -150,4 +330,143 @@ def dijkstra(grid, start, goal):
                     heapq.heappush(min_heap, (new_cost, neighbor))
                     came_from[neighbor] = current
 
+    search_stats.record('dijkstra', len(visited))
     return None  # No path found
+
+
+# Jump Point Search: A* over "jump points" only, skipping the symmetric runs of open cells in between.
+# Jumps cost their number of steps, so the returned paths are as short as astar's.
+def jps(grid, start, goal):
+    buffers = _search_buffers(grid)
+    width, blocked = buffers.width, buffers.blocked
+    source = (start[0] + 1) * width + start[1] + 1
+    target = (goal[0] + 1) * width + goal[1] + 1
+    if blocked[target]:
+        search_stats.record('jps', 0)
+        return None
+    goal_row, goal_col = goal[0] + 1, goal[1] + 1
+
+    # Walk from `cell` in direction (dx, dy) until reaching the goal, an obstacle or a cell with a forced neighbor
+    def jump(cell, dx, dy):
+        step = dx * width + dy
+        while True:
+            cell += step
+            if blocked[cell]:
+                return None
+            if cell == target:
+                return cell
+            if dx and dy:
+                if ((blocked[cell - dx * width] and not blocked[cell - dx * width + dy]) or
+                        (blocked[cell - dy] and not blocked[cell + dx * width - dy])):
+                    return cell
+                if jump(cell, dx, 0) is not None or jump(cell, 0, dy) is not None:
+                    return cell
+            elif dx:
+                if ((blocked[cell + 1] and not blocked[cell + dx * width + 1]) or
+                        (blocked[cell - 1] and not blocked[cell + dx * width - 1])):
+                    return cell
+            else:
+                if ((blocked[cell + width] and not blocked[cell + width + dy]) or
+                        (blocked[cell - width] and not blocked[cell - width + dy])):
+                    return cell
+
+    # Directions worth exploring from `cell` when it was reached moving in direction (dx, dy)
+    def directions(cell, dx, dy):
+        if dx and dy:
+            dirs = [(dx, 0), (0, dy), (dx, dy)]
+            if blocked[cell - dx * width]:
+                dirs.append((-dx, dy))
+            if blocked[cell - dy]:
+                dirs.append((dx, -dy))
+        elif dx:
+            dirs = [(dx, 0)]
+            if blocked[cell + 1]:
+                dirs.append((dx, 1))
+            if blocked[cell - 1]:
+                dirs.append((dx, -1))
+        else:
+            dirs = [(0, dy)]
+            if blocked[cell + width]:
+                dirs.append((1, dy))
+            if blocked[cell - width]:
+                dirs.append((-1, dy))
+        return dirs
+
+    def h(cell):
+        return max(abs(cell // width - goal_row), abs(cell % width - goal_col))
+
+    # With every move costing 1, a jump point is often reached at the same cost from several
+    # directions, and each direction unlocks different successors; so instead of closing a cell
+    # after its first expansion, remember which directions it has already been expanded for.
+    gscore = {source: 0}
+    came_from = {}
+    incoming = {source: {None}}                                 # Directions a cell was reached from at its best cost
+    explored = {}                                               # Jump directions already tried from a cell
+    oheap = [(h(source), 0, source)]
+    expanded = 0                                                # Jump point expansions; the cells jumped over are not counted
+    while oheap:
+        _, depth, current = heapq.heappop(oheap)
+        g = -depth
+        if current == target:
+            search_stats.record('jps', expanded)
+            jump_points = [current]
+            while current in came_from:
+                current = came_from[current]
+                jump_points.append(current)
+            return _expand_jump_points(jump_points[::-1], width)
+        if g > gscore[current]:
+            continue
+        expanded += 1
+
+        done = explored.setdefault(current, set())
+        dirs = set()
+        for direction in incoming[current]:
+            dirs.update(NEIGHBORS if direction is None else directions(current, *direction))
+        for dx, dy in dirs - done:
+            done.add((dx, dy))
+            point = jump(current, dx, dy)
+            if point is None:
+                continue
+            tentative_g_score = g + max(abs(point // width - current // width), abs(point % width - current % width))
+            best = gscore.get(point)
+            if best is None or tentative_g_score < best:
+                gscore[point] = tentative_g_score
+                came_from[point] = current
+                incoming[point] = {(dx, dy)}
+                heapq.heappush(oheap, (tentative_g_score + h(point), -tentative_g_score, point))
+            elif tentative_g_score == best and (dx, dy) not in incoming[point]:
+                incoming[point].add((dx, dy))
+                heapq.heappush(oheap, (tentative_g_score + h(point), -tentative_g_score, point))
+
+    search_stats.record('jps', expanded)
+    return None
+
+
+# Fill in the straight or diagonal runs between consecutive jump points (padded flat indices).
+def _expand_jump_points(jump_points, width):
+    path = [(jump_points[0] // width - 1, jump_points[0] % width - 1)]
+    for a, b in zip(jump_points, jump_points[1:]):
+        row, col = a // width - 1, a % width - 1
+        drow = (b // width > a // width) - (b // width < a // width)
+        dcol = (b % width > a % width) - (b % width < a % width)
+        for _ in range(max(abs(b // width - a // width), abs(b % width - a % width))):
+            row, col = row + drow, col + dcol
+            path.append((row, col))
+    return path
+
+
+# Hierarchical planner for large maps, see hierarchical.py (imported here to avoid a circular import)
+def hpa(grid, start, goal):
+    from hierarchical import hpa_star
+    return hpa_star(grid, start, goal)
+
+
+# Planners selectable by name, all with the same (grid, start, goal) signature
+PLANNERS = {
+    'astar': astar,
+    'jps': jps,
+    'hpa': hpa,
+    'bfs': bfs,
+    'dfs': dfs,
+    'dijkstra': dijkstra,
+}
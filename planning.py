@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import deque
+from distance import DistanceOracle
+from pathfinding import grid_changed
+from assignment import plan_batches, MAX_ORDERS_PER_ROBOT, GROUP_RADIUS
+import hierarchical
+
+
+"""Plans assignment rounds and replans paths on a worker thread while the simulation keeps running
+
+The worker owns a copy of the map (kept in step by update_cells()) and its own distance fields, so
+jobs never touch the live simulation. Every job is tagged with the map version it was submitted
+under; finished() hands back results at a tick boundary, dropping those planned on an older map.
+On a virtual clock the simulation calls wait() at every tick boundary, so a job submitted on one
+tick is committed on the next whatever the thread scheduling, and headless runs are reproducible.
+"""
+class PlanningService:
+    def __init__(self, grid, planner, route_optimizer='auto', max_orders=MAX_ORDERS_PER_ROBOT, mode='greedy'):
+        self.grid = grid.copy()                     # The worker's copy of the map
+        self.planner = planner                      # Pathfinding function for replanning jobs
+        self.route_optimizer = route_optimizer
+        self.max_orders = max_orders
+        self.mode = mode                            # Assignment mode, see assignment.plan_batches
+        self.distances = DistanceOracle(self.grid)  # Only used from the worker thread
+        self.version = 0                            # Bumped on every map change
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='planner')
+        self.pending = deque()                      # (kind, key, version, future) in submission order
+        self.discarded = 0                          # Results dropped because the map changed under them
+
+    # Runs on the worker, ahead of every job submitted after the change
+    def _apply(self, changes):
+        for cell, blocked in changes.items():
+            self.grid[cell] = 1 if blocked else 0
+        grid_changed(self.grid, changes)
+        hierarchical.cells_changed(self.grid, list(changes))
+        self.distances.invalidate(list(changes))
+
+    def _submit(self, kind, key, fn, *args):
+        self.pending.append((kind, key, self.version, self.executor.submit(fn, *args)))
+
+    '''Mirror map changes {cell: blocked} on the worker; results planned before them become stale'''
+    def update_cells(self, changes):
+        self.version += 1
+        self.executor.submit(self._apply, dict(changes))
+
+    '''Whether a job of `kind` (and `key`, if given) is still waiting for its result'''
+    def busy(self, kind, key=None):
+        return any(job[0] == kind and (key is None or job[1] == key) for job in self.pending)
+
+    '''Plan an assignment round (see assignment.plan_batches) from a snapshot of the orders and idle robots
+
+    `index` is a snapshot of the order store's index, taken on the simulation thread.
+    '''
+    def submit_assignment(self, unassigned, robots, now, index=None):
+        self._submit('assign', None, plan_batches, list(unassigned), list(robots), now, self.distances,
+                     self.route_optimizer, self.max_orders, GROUP_RADIUS, self.mode, index)
+
+    '''Find a new path for robot `key` from `start` to `goal`'''
+    def submit_replan(self, key, start, goal):
+        self._submit('replan', key, self.planner, self.grid, start, goal)
+
+    '''Block until every job submitted so far has finished'''
+    def wait(self):
+        wait([job[3] for job in self.pending])
+
+    '''Results of the jobs finished so far, as (kind, key, result), in submission order'''
+    def finished(self):
+        results = []
+        while self.pending and self.pending[0][3].done():
+            kind, key, version, future = self.pending.popleft()
+            if version != self.version:
+                self.discarded += 1
+                continue
+            results.append((kind, key, future.result()))
+        return results
+
+    '''Stop the worker, dropping the jobs that have not started'''
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pending.clear()
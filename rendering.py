@@ -0,0 +1,118 @@
+import pygame
+
+CELL_SIZE = 30                        # Size of each grid cell in pixels, shrunk for maps that would not fit MAX_MAP_PIXELS
+MAX_MAP_PIXELS = 900                  # Largest width or height of the drawn map
+GRID_COLOR = (200, 200, 200)
+OBSTACLE_COLOR = (0, 0, 0)
+ROBOT_COLOR = (255, 165, 0)
+ORDER_COLOR = (150, 150, 150)         # New order (unassigned) - Gray-ish
+ASSIGNED_ORDER_COLOR = (255, 0, 0)    # Assigned (not yet picked up) - Red
+DELIVERED_ORDER_COLOR = (0, 200, 0)   # Delivered - Green
+WAREHOUSE_COLOR = (0, 0, 255)
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+'''Pixel size of a cell for a grid of `shape`: CELL_SIZE, or less so the map fits in MAX_MAP_PIXELS'''
+def cell_size_for(shape):
+    return max(4, min(CELL_SIZE, MAX_MAP_PIXELS // max(shape)))
+
+
+'''Color of an order's marker: delivered, assigned, or a gray that darkens every second it waits'''
+def order_color(order, now):
+    if order.delivered:
+        return DELIVERED_ORDER_COLOR
+    if order.assigned:
+        return ASSIGNED_ORDER_COLOR
+    age = (now - order.created_time) // 1000  # seconds
+    shade = max(50, 150 - age * 10)  # gets darker every 1s, stops at 50
+    return (shade, shade, shade)
+
+
+"""Draws the map with dirty rectangles instead of repainting every cell each frame
+
+Obstacles, grid lines and the warehouses are pre-rendered once to a background surface. Each frame
+only the cells whose order marker or robot changed since the last frame are restored from the
+background and redrawn, and draw() returns their rectangles for pygame.display.update(). The work
+per frame follows the number of orders and robots, not the size of the map.
+"""
+class GridRenderer:
+    def __init__(self, screen, grid, warehouses, cell_size=None):
+        self.screen = screen
+        self.grid = grid
+        self.warehouses = set(warehouses)                   # Warehouse cells
+        self.cell_size = cell_size or cell_size_for(grid.shape)
+        self.width = grid.shape[1] * self.cell_size         # Size of the map area in pixels
+        self.height = grid.shape[0] * self.cell_size
+        self.background = pygame.Surface((self.width, self.height))
+        self.drawn = {}                                     # cell -> (order color or None, robot there) as on screen
+        self.stale = set()                                  # Cells whose background changed since they were drawn
+        self.full_redraw = True                             # Next draw() repaints the whole map
+        self._draw_background()
+
+    def _rect(self, cell):
+        return pygame.Rect(cell[1] * self.cell_size, cell[0] * self.cell_size, self.cell_size, self.cell_size)
+
+    # Paint one cell of the static map onto the background surface
+    def _draw_static_cell(self, cell):
+        rect = self._rect(cell)
+        pygame.draw.rect(self.background, BACKGROUND_COLOR, rect)
+        if cell in self.warehouses:
+            pygame.draw.rect(self.background, WAREHOUSE_COLOR, rect)
+        elif self.grid[cell] != 0:
+            pygame.draw.rect(self.background, OBSTACLE_COLOR, rect)
+        else:
+            pygame.draw.rect(self.background, GRID_COLOR, rect, 1)
+
+    def _draw_background(self):
+        self.background.fill(BACKGROUND_COLOR)
+        for x in range(self.grid.shape[0]):
+            for y in range(self.grid.shape[1]):
+                self._draw_static_cell((x, y))
+
+    '''Repaint the background under changed map cells; they are redrawn on the next frame'''
+    def cells_changed(self, cells):
+        for cell in cells:
+            self._draw_static_cell(cell)
+        self.stale.update(cells)
+
+    # Draw a cell's marker over the (already restored) background
+    def _draw_cell(self, cell, state):
+        color, robot = state
+        rect = self._rect(cell)
+        if color is not None:
+            pygame.draw.circle(self.screen, color, rect.center, self.cell_size // 3)
+        if robot:
+            inset = self.cell_size // 6
+            pygame.draw.rect(self.screen, ROBOT_COLOR, rect.inflate(-2 * inset, -2 * inset))
+
+    '''Bring the map area of the screen up to date; returns the rectangles that changed'''
+    def draw(self, orders, robots, now):
+        wanted = {}
+        for order in orders:
+            wanted[order.location] = (order_color(order, now), False)
+        for robot in robots:
+            color = wanted.get(robot.position, (None, False))[0]
+            wanted[robot.position] = (color, True)
+
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            for cell, state in wanted.items():
+                self._draw_cell(cell, state)
+            self.drawn = wanted
+            self.stale.clear()
+            self.full_redraw = False
+            return [pygame.Rect(0, 0, self.width, self.height)]
+
+        rects = []
+        for cell in set(self.drawn) | set(wanted) | self.stale:
+            state = wanted.get(cell)
+            if self.drawn.get(cell) == state and cell not in self.stale:
+                continue
+            rect = self._rect(cell)
+            self.screen.blit(self.background, rect, rect)   # Restore the static map under the cell
+            if state is not None:
+                self._draw_cell(cell, state)
+            rects.append(rect)
+        self.drawn = wanted
+        self.stale.clear()
+        return rects
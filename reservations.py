@@ -0,0 +1,269 @@
+import heapq
+from array import array
+from collections import OrderedDict
+import numpy as np
+from pathfinding import NEIGHBORS, grid_epoch, search_stats
+from distance import UNREACHABLE
+
+WINDOW = 32                           # Ticks of each plan checked against the other robots (windowed cooperative A*)
+MAX_EXPANSIONS = 20000                # Search budget of one plan; past it the robot holds its cell and tries again
+APRON = 2                             # Cells this close to a warehouse (Chebyshev) are kept clear of parked robots
+HEURISTIC_CELLS = 8_000_000           # Cells of single-robot cost fields kept, over every cached goal
+
+
+"""Space-time reservations of the fleet and the cooperative planner that respects them
+
+Time is counted in simulation ticks. Every robot reserves the cells it will occupy, tick by tick,
+in a hash per tick ({tick: {cell: robot}}); ticks that have passed are dropped by advance(), so the
+table only ever holds the rolling window ahead of `now`. A robot stays in a cell from the tick it
+enters it to the tick it leaves, both included, so two robots can neither share a cell nor swap
+cells. Where a plan ends the robot parks: its cell stays reserved from then on, until it plans again.
+
+plan() is space-time A*: a move into a cell takes the cell's speed delay plus one tick, as in
+Robot.move(), and waiting in place takes one tick. The other robots' reservations are only searched
+WINDOW ticks ahead; the plan ends at the goal or at the first cell past the window where the robot
+can park, and the robot plans the next stretch from there. Each search therefore covers about one
+window of a single-robot search, whatever the size of the fleet: the heuristic is the exact cost of
+the goal for a robot alone on the map (one backwards Dijkstra per goal, cached), so the search only
+widens where other robots are in the way. Warehouse cells hold any number of robots and are never
+reserved.
+
+Two rules keep the traffic around a warehouse from locking up: no robot parks within APRON cells of
+a warehouse unless that is its goal, and a robot that left a warehouse never plans to step back
+into one it is not heading for. Outbound robots then wait inside until they can get clear, and
+inbound robots always find the way in free of parked robots; a robot stuck elsewhere may step into
+a warehouse to let the others pass.
+
+Robots follow their plans to the tick (Robot.move holds a robot until its next cell is due), which
+keeps the fleet conflict-free.
+"""
+class ReservationTable:
+    def __init__(self, grid, clearance, exempt=(), window=WINDOW, max_expansions=MAX_EXPANSIONS):
+        self.grid = grid
+        self.clearance = clearance      # Speed delay per cell
+        self.window = window
+        self.max_expansions = max_expansions
+        self.width = grid.shape[1] + 2  # Cells are flat indices into the grid padded with a ring of obstacles
+        self.exempt = {self._flat(cell) for cell in exempt}     # Cells shared freely (the warehouses)
+        self.apron = {self._flat((x + i, y + j)) for x, y in exempt      # Around the warehouses: nobody parks there
+                      for i in range(-APRON, APRON + 1) for j in range(-APRON, APRON + 1)
+                      if 0 <= x + i < grid.shape[0] and 0 <= y + j < grid.shape[1]} - self.exempt
+        self.now = 0                    # Current tick
+        self.last = 0                   # Latest tick reserved so far
+        self.slots = {}                 # tick -> {cell: robot}, for the ticks from `now` on
+        self.parked = {}                # cell -> (robot, tick from which it stays there)
+        self.held = {}                  # robot -> [(tick, cell)] it reserved
+        self.parking = {}               # robot -> cell it is parked on
+        self.epoch = None               # grid_changed() count the layout below was built for
+        self.blocked = None
+        self.delay = None
+        self.heuristics = OrderedDict()     # goal -> single-robot cost field (padded, flat), in LRU order
+        self.max_heuristics = max(16, HEURISTIC_CELLS // grid.size)     # One per robot goal on all but huge maps
+
+    def _flat(self, cell):
+        return (cell[0] + 1) * self.width + cell[1] + 1
+
+    def _cell(self, flat):
+        x, y = divmod(flat, self.width)
+        return x - 1, y - 1
+
+    # Rebuild the padded obstacle and delay layout after the map changed
+    def _layout(self):
+        epoch = grid_epoch(self.grid)
+        if epoch == self.epoch and self.blocked is not None:
+            return
+        self.epoch = epoch
+        self.blocked = np.pad(self.grid != 0, 1, constant_values=True).ravel().tobytes()
+        self.delay = np.pad(self.clearance.delay, 1).ravel().astype(np.int64).tolist()
+        self.heuristics.clear()
+
+    # Ticks from leaving each cell to leaving `goal` for a robot alone on the map, -1 where unreachable.
+    # Entering a cell costs its speed delay plus one tick, so this is the exact single-robot cost: Dial's
+    # algorithm, a Dijkstra with one bucket per tick, run backwards from the goal.
+    def _heuristic(self, goal):
+        field = self.heuristics.get(goal)
+        if field is not None:
+            self.heuristics.move_to_end(goal)
+            return field
+        blocked, delay = self.blocked, self.delay
+        offsets = [i * self.width + j for i, j in NEIGHBORS]
+        field = [UNREACHABLE] * len(blocked)
+        target = self._flat(goal)
+        field[target] = 0
+        buckets = [[target]]
+        t = 0
+        while t < len(buckets):
+            for cell in buckets[t]:
+                if field[cell] != t:
+                    continue                                    # Reached again later with a lower cost
+                cost = t + delay[cell] + 1                      # From a neighbor: enter `cell`, wait out its delay
+                while len(buckets) <= cost:
+                    buckets.append([])
+                bucket = buckets[cost]
+                for offset in offsets:
+                    neighbor = cell + offset
+                    if not blocked[neighbor] and not 0 <= field[neighbor] <= cost:
+                        field[neighbor] = cost
+                        bucket.append(neighbor)
+            t += 1
+        self.heuristics[goal] = field = array('i', field)
+        if len(self.heuristics) > self.max_heuristics:
+            self.heuristics.popitem(last=False)
+        return field
+
+    '''Move the table to tick `now`, dropping the reservations of the ticks before it'''
+    def advance(self, now):
+        for tick in range(self.now, now):
+            self.slots.pop(tick, None)
+        self.now = now
+
+    '''Drop every reservation of `robot`, including its parking cell'''
+    def release(self, robot):
+        for tick, cell in self.held.pop(robot, ()):
+            slot = self.slots.get(tick)
+            if slot is not None and slot.get(cell) == robot:
+                del slot[cell]
+        cell = self.parking.pop(robot, None)
+        if cell is not None and self.parked.get(cell, (None,))[0] == robot:
+            del self.parked[cell]
+
+    '''Park `robot` on `cell` from tick `since` on (until its next plan)'''
+    def park(self, robot, cell, since=None):
+        flat = self._flat(cell)
+        if flat not in self.exempt:
+            self.parked[flat] = (robot, self.now if since is None else since)
+            self.parking[robot] = flat
+
+    # Whether `robot` may be on `cell` at `tick`
+    def _free(self, robot, cell, tick):
+        if cell in self.exempt:
+            return True
+        slot = self.slots.get(tick)
+        if slot is not None and slot.get(cell, robot) != robot:
+            return False
+        parked = self.parked.get(cell)
+        return parked is None or parked[0] == robot or parked[1] > tick
+
+    # Whether `robot` may stay on `cell` from `tick` on: nobody else reserved it later. Robots may only
+    # stop on a warehouse's apron at their goal (they plan on from there at once), so the way in stays open.
+    def _parkable(self, robot, cell, tick, goal=False):
+        if cell in self.exempt:
+            return True
+        if cell in self.apron and not goal:
+            return False
+        parked = self.parked.get(cell)
+        if parked is not None and parked[0] != robot:
+            return False
+        slots = self.slots
+        for later in range(tick + 1, self.last + 1):
+            slot = slots.get(later)
+            if slot is not None and slot.get(cell, robot) != robot:
+                return False
+        return True
+
+    '''Conflict-free path of `robot` from `start` towards `goal`, reserved in the table
+
+    The robot stays on `start` until tick `ready` at the earliest. Returns (path, schedule): the path
+    starts at `start` like the other planners' and may stop short of the goal (at the end of the
+    window); schedule[i] is the tick at which path[i + 1] is entered. Returns None if the goal cannot
+    be reached or the search ran out of budget; the robot is then parked where it is.
+    '''
+    def plan(self, robot, start, goal, ready):
+        self._layout()
+        heuristic = self._heuristic(goal)
+        source, target = self._flat(start), self._flat(goal)
+        ready = max(ready, self.now)
+        if heuristic[source] < 0:
+            self.release(robot)
+            self.park(robot, start)
+            return None
+
+        blocked, delay, exempt = self.blocked, self.delay, self.exempt
+        slots, parked = self.slots, self.parked
+        offsets = [i * self.width + j for i, j in NEIGHBORS]
+        limit = ready + self.window                             # Reservations are searched up to here
+        retreat = source not in exempt                          # Stepping into a warehouse to let others pass
+        give_up = limit + self.window                           # No parking spot by then: drop the branch
+        parent = {(source, ready): None}
+        heap = [(ready + heuristic[source], heuristic[source], ready, source)]
+        expanded = 0
+        found = None
+        while heap and expanded < self.max_expansions:
+            _, _, tick, cell = heapq.heappop(heap)
+            expanded += 1
+            if (cell == target or tick >= limit) and self._parkable(robot, cell, tick, cell == target):
+                found = (cell, tick)
+                break
+            if tick >= give_up:
+                continue
+            key = (cell, tick + 1)                              # Wait in place for one tick
+            if key not in parent and self._free(robot, cell, tick + 1):
+                parent[key] = (cell, tick)
+                heapq.heappush(heap, (tick + 1 + heuristic[cell], heuristic[cell], tick + 1, cell))
+            for offset in offsets:
+                neighbor = cell + offset
+                h = heuristic[neighbor]
+                if h < 0 or blocked[neighbor]:
+                    continue
+                leave = tick + delay[neighbor] + 1              # Entered at `tick`, left at `leave` at the earliest
+                key = (neighbor, leave)
+                if key in parent:
+                    continue
+                if neighbor in exempt:
+                    if neighbor != target and not retreat:
+                        continue                                # Leaving a warehouse just to come back would block the way out
+                else:                                           # Same test as _free(), inlined: this is the hot loop
+                    park = parked.get(neighbor)
+                    if park is not None and park[0] != robot and park[1] <= leave:
+                        continue
+                    if any(slot.get(neighbor, robot) != robot
+                           for slot in map(slots.get, range(tick, leave + 1)) if slot):
+                        continue
+                parent[key] = (cell, tick)
+                heapq.heappush(heap, (leave + h, h, leave, neighbor))
+        search_stats.record('cooperative', expanded)
+
+        self.release(robot)
+        if found is None:
+            self.park(robot, start)
+            return None
+        states = []
+        while found is not None:
+            states.append(found)
+            found = parent[found]
+        states.reverse()
+        return self._reserve(robot, states)
+
+    # Reserve the cells of the searched states (cell, tick the robot may leave it) and park at the last one
+    def _reserve(self, robot, states):
+        path = [self._cell(states[0][0])]
+        schedule = []
+        held = []
+        cell, entered = states[0][0], self.now
+        for (previous, tick), (following, _) in zip(states, states[1:]):
+            if following == previous:
+                continue                                        # Waited
+            held.extend(self._hold(robot, cell, entered, tick))
+            path.append(self._cell(following))
+            schedule.append(tick)
+            cell, entered = following, tick
+        end = states[-1][1]
+        held.extend(self._hold(robot, cell, entered, end))
+        if len(path) == 1 and len(states) > 1:
+            path.append(path[0])                                # Only waited: step in place at the end, then plan again
+            schedule.append(end)
+        self.held[robot] = held
+        self.park(robot, self._cell(cell), end)
+        self.last = max(self.last, end)
+        return path, schedule
+
+    def _hold(self, robot, cell, first, last):
+        if cell in self.exempt:
+            return []
+        slots = self.slots
+        for tick in range(first, last + 1):
+            slot = slots.get(tick)
+            if slot is None:
+                slot = slots[tick] = {}
+            slot[cell] = robot
+        return [(tick, cell) for tick in range(first, last + 1)]
@@ -0,0 +1,140 @@
+import numpy as np
+
+EXACT_LIMIT = 12                      # Largest number of stops solved exactly by Held-Karp in "auto" mode
+
+
+# Pairwise move counts between the start (row/column 0) and every stop, np.inf where unreachable.
+def distance_matrix(oracle, start, stops):
+    points = [start] + list(stops)
+    xs = np.array([p[0] for p in points])
+    ys = np.array([p[1] for p in points])
+    matrix = np.empty((len(points), len(points)), dtype=float)
+    matrix[:, 0] = oracle.field(start)[xs, ys]                  # One cached field answers the start's column
+    for j, point in enumerate(stops, 1):
+        matrix[1:, j] = oracle.distances(point, stops)          # Flooded only as far as the other stops
+        matrix[0, j] = matrix[j, 0]                             # Moves are symmetric
+    matrix[matrix < 0] = np.inf
+    return matrix
+
+
+# Total cost of visiting the stops in `route` (indices into the matrix) starting from row 0.
+def route_cost(matrix, route):
+    cost = 0.0
+    last = 0
+    for stop in route:
+        cost += matrix[last, stop]
+        last = stop
+    return cost
+
+
+# Exact open-path ordering by dynamic programming over subsets, O(2^n * n^2) for n stops.
+def held_karp(matrix):
+    n = len(matrix) - 1
+    if n == 0:
+        return []
+    legs = matrix[1:, 1:]
+    full = 1 << n
+    dp = np.full((full, n), np.inf)                             # dp[mask, j]: cheapest way to visit `mask`, ending at stop j
+    parent = np.zeros((full, n), dtype=np.int64)
+    bits = 1 << np.arange(n)
+    masks = np.arange(full)
+    sizes = np.zeros(full, dtype=np.int64)
+    for bit in bits:
+        sizes += (masks & bit) != 0
+    dp[bits, np.arange(n)] = matrix[0, 1:]
+
+    # Fill one subset size at a time so every predecessor is already final
+    for size in range(2, n + 1):
+        layer = masks[sizes == size]
+        for j in range(n):
+            ending = layer[(layer & bits[j]) != 0]
+            candidates = dp[ending ^ bits[j]] + legs[:, j]
+            parent[ending, j] = candidates.argmin(axis=1)
+            dp[ending, j] = candidates.min(axis=1)
+
+    mask = full - 1
+    last = int(dp[mask].argmin())
+    if not np.isfinite(dp[mask, last]):
+        return None
+    route = []
+    for _ in range(n):
+        route.append(last + 1)
+        previous = int(parent[mask, last])
+        mask ^= 1 << last
+        last = previous
+    return route[::-1]
+
+
+# Grow the route by repeatedly inserting the stop whose cheapest insertion adds the least cost.
+def cheapest_insertion(matrix):
+    remaining = list(range(1, len(matrix)))
+    route = []
+    while remaining:
+        sequence = [0] + route
+        left = np.array(sequence)
+        right = np.array(route)
+        best = None
+        for stop in remaining:
+            # Inserting between consecutive stops, or appending at the end of the open path
+            between = matrix[left[:-1], stop] + matrix[stop, right] - matrix[left[:-1], right] if route else np.empty(0)
+            costs = np.append(between, matrix[sequence[-1], stop])
+            position = int(costs.argmin())
+            if best is None or costs[position] < best[0]:
+                best = (costs[position], stop, position)
+        cost, stop, position = best
+        if not np.isfinite(cost):
+            return None
+        route.insert(position, stop)
+        remaining.remove(stop)
+    return route
+
+
+# Reverse segments of an open path while that shortens it (distances are symmetric).
+def two_opt(matrix, route):
+    if route is None:
+        return None
+    sequence = [0] + list(route)
+    n = len(sequence)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b, c = sequence[i - 1], sequence[i], sequence[j]
+                delta = matrix[a, c] - matrix[a, b]
+                if j + 1 < n:
+                    e = sequence[j + 1]
+                    delta += matrix[b, e] - matrix[c, e]
+                if delta < -1e-9:
+                    sequence[i:j + 1] = sequence[i:j + 1][::-1]
+                    improved = True
+    return sequence[1:]
+
+
+def insertion_two_opt(matrix):
+    return two_opt(matrix, cheapest_insertion(matrix))
+
+
+# Held-Karp while it is affordable, the insertion heuristic for larger batches.
+def auto(matrix, exact_limit=EXACT_LIMIT):
+    if len(matrix) - 1 <= exact_limit:
+        return held_karp(matrix)
+    return insertion_two_opt(matrix)
+
+
+ROUTE_OPTIMIZERS = {
+    'auto': auto,
+    'held_karp': held_karp,
+    'insertion': insertion_two_opt,
+}
+
+
+# Order of stop indices (1-based, into the matrix) for the chosen optimizer, or None if a stop is unreachable.
+def optimize_route(matrix, optimizer='auto'):
+    if callable(optimizer):
+        route = optimizer(matrix)
+    else:
+        route = ROUTE_OPTIMIZERS[optimizer](matrix)
+    if route is None or not np.isfinite(route_cost(matrix, route)):
+        return None
+    return route
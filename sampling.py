@@ -0,0 +1,76 @@
+import numpy as np
+
+
+"""Free cells reachable from a warehouse, sampled uniformly in O(1)
+
+The warehouses' flood fill (warehouses.Warehouses) gives every cell a robot can get to. The ones that can take an
+order (free, not the warehouse, no order on them yet) are kept as flat indices at the front of an
+array, with each cell's slot in a second array, so a cell is drawn with one random index and taken
+or given back by swapping with the last entry. Both arrays are built with NumPy, which keeps
+start-up fast on big maps. rebuild() reads the fill again once the warehouses were rebuilt.
+"""
+class ReachableCells:
+    def __init__(self, grid, warehouses, occupied=()):
+        self.grid = grid
+        self.warehouses = warehouses    # Warehouses the cells must be reachable from
+        self.width = grid.shape[1]      # Cells are stored as x * width + y
+        self.cells = None               # Flat indices; the first `count` are the pool, in no particular order
+        self.slots = None               # Flat index -> its slot in self.cells, -1 if not in the pool
+        self.count = 0
+        self.reachable = None           # Boolean mask of the cells reachable from a warehouse (warehouses excluded)
+        self.rebuild(occupied)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, cell):
+        x, y = cell
+        if not (0 <= x < self.grid.shape[0] and 0 <= y < self.width):
+            return False                # Off the map: a flat index would wrap onto another cell
+        return self.slots[x * self.width + y] >= 0
+
+    def _cell(self, index):
+        x, y = divmod(int(self.cells[index]), self.width)
+        return x, y
+
+    '''Rebuild the pool from the warehouses' current flood fill, leaving out the `occupied` cells'''
+    def rebuild(self, occupied=()):
+        self.reachable = self.warehouses.distance > 0
+        pool = np.flatnonzero(self.reachable)
+        self.cells = np.empty(self.grid.size, dtype=np.int64)
+        self.cells[:len(pool)] = pool
+        self.slots = np.full(self.grid.size, -1, dtype=np.int64)
+        self.slots[pool] = np.arange(len(pool))
+        self.count = len(pool)
+        for cell in occupied:
+            self.take(cell)
+
+    '''Remove `cell` from the pool, e.g. when an order is placed on it'''
+    def take(self, cell):
+        flat = cell[0] * self.width + cell[1]
+        i = self.slots[flat]
+        if i < 0:
+            return
+        self.count -= 1
+        last = self.cells[self.count]
+        self.cells[i] = last
+        self.slots[last] = i
+        self.slots[flat] = -1
+
+    '''Put `cell` back once its order is gone, if it is still reachable and free'''
+    def release(self, cell):
+        flat = cell[0] * self.width + cell[1]
+        if self.slots[flat] < 0 and self.reachable[cell] and self.grid[cell] == 0:
+            self.cells[self.count] = flat
+            self.slots[flat] = self.count
+            self.count += 1
+
+    '''A uniformly random cell of the pool (left in it), or None if the pool is empty'''
+    def sample(self, rng):
+        if not self.count:
+            return None
+        return self._cell(rng.randrange(self.count))
+
+    '''Up to `n` distinct random cells of the pool (left in it)'''
+    def sample_many(self, rng, n):
+        return [self._cell(i) for i in rng.sample(range(self.count), min(n, self.count))]
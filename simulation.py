@@ -1,21 +1,29 @@
-from itertools import permutations
-
 import pygame
 import sys
 import random
-from config import MAP_SIZE, FW_LOCATION
-from pathfinding import astar,dfs,bfs,dijkstra 
+import time
+from config import WAREHOUSES
+from clock import PygameClock, VirtualClock
+from distance import DistanceOracle
+from assignment import plan_batches, MAX_ORDERS_PER_ROBOT
+from orders import Order, OrderStore
+from clearance import ClearanceMap, speed_mode
+from pathfinding import astar,dfs,bfs,dijkstra,PLANNERS,grid_changed
+from incremental import DStarLite
+import hierarchical
+from fleet import Fleet, WAREHOUSE_WAIT_MS
+from planning import PlanningService
+from parallel import ParallelPlanner
+from instrumentation import Instrumentation
+from rendering import GridRenderer, cell_size_for
+from sampling import ReachableCells
+from reservations import ReservationTable
+from warehouses import Warehouses
+from sla import ServiceMetrics, EXPORT_INTERVAL_MS
 import numpy as np
+from collections import deque
 
-CELL_SIZE = 30                        # Size of each grid cell in pixels
-GRID_COLOR = (200, 200, 200)
-OBSTACLE_COLOR = (0, 0, 0)
-ROBOT_COLOR = (255, 165, 0)
-ORDER_COLOR = (150, 150, 150)         # New order (unassigned) - Gray-ish
-ASSIGNED_ORDER_COLOR = (255, 0, 0)    # Assigned (not yet picked up) - Red
-DELIVERED_ORDER_COLOR = (0, 200, 0)   # Delivered - Green
-WAREHOUSE_COLOR = (0, 0, 255)
-MAX_ORDERS_PER_ROBOT = 4              # Maximum number of orders a robot can carry once 
+PANEL_HEIGHT = 120                    # Stats panel below the map, in pixels
 
 """This class handles individual robot behavior
 
@@ -26,212 +34,350 @@ class Robot:
         self.position = position        # Position                                         ex: (0, 0)
         self.path = []                  # List of locations to follow                      ex: [(0, 1), (0, 2), (0, 3)] 
         self.busy = False               # Whether robot is currently delivering            
-        self.orders_queue = []          # Queue of orders                                  ex: [{'order_id': 1, 'location': (0, 3), 'assigned': True, 'delivered': False, 'created_time': 10000},{'order_id': 2, 'location': (2, 5), 'assigned': True, 'delivered': False, 'created_time': 11000}]
+        self.orders_queue = deque()     # Queue of orders                                  ex: deque([Order(1, (0, 3)), Order(2, (2, 5))])
         self.move_delay = 0             # Simulate speed control
         self.waiting = False            # Whether robot is currently in a wait state
         self.wait_start_time = None     # Timestamp from when waiting started
         self.at_warehouse = True        # Whether the robot is at warehouse
         self.total_delivery_time = 0    # Total time taken for all deliveries
         self.deliveries = 0             # Number of successful deliveries
+        self.clock = None               # Time source, shared from the simulation
+        self.order_store = None         # Order bookkeeping, shared from the simulation
+        self.clearance = None           # Precomputed obstacle clearance, shared from the simulation
+        self.warehouses = None          # Warehouses and the nearest one to every cell, shared from the simulation
+        self.planner = astar            # Pathfinding function (grid, start, goal), see pathfinding.PLANNERS
+        self.replanner = None           # Incremental planner for the current leg, created on the first map change
+        self.awaiting_plan = None       # Goal of a path being planned in the background; the robot holds until it arrives
+        self.reservations = None        # Shared reservations.ReservationTable when the fleet plans cooperatively
+        self.schedule = deque()         # Cooperative planning: tick at which each cell of the path is due
+        self.sla = None                 # sla.ServiceMetrics of the simulation, which counts the busy robots
+
+    '''Set the busy flag, keeping the simulation's count of busy robots'''
+    def set_busy(self, busy):
+        if busy != self.busy:
+            self.busy = busy
+            if self.sla is not None:
+                self.sla.busy_robots += 1 if busy else -1
 
     '''Adds a new delivery to the robot's task list and sets its next path if idle. '''
     def add_order(self, path, order):
         self.orders_queue.append(order)
-        self.busy = True
+        self.set_busy(True)
         if not self.path:
-            self.path = path[1:]                            # Skip current location
+            if self.reservations is not None:
+                path = self.route(order.location)           # Planned again around the other robots' reservations
+            self.path = path[1:] if path else []            # Skip current location
+
+    '''Path from the current position to `goal`, like self.planner
+
+    When the fleet plans cooperatively the path is reserved against the other robots (it may end
+    short of the goal) and self.schedule is set to match; the robot can leave its cell at tick
+    `ready` at the earliest (by default once its speed delay has passed again).
+    '''
+    def route(self, goal, ready=None):
+        if self.reservations is None:
+            return self.planner(self.grid, self.position, goal)
+        if ready is None:
+            ready = self.reservations.now + int(self.clearance.delay[self.position]) + 1
+        planned = self.reservations.plan(self.robot_id, self.position, goal, ready)
+        if planned is None:
+            self.schedule = deque()
+            return None
+        path, schedule = planned
+        self.schedule = deque(schedule)
+        return path
+
+    '''Cooperative planning: whether the next cell of the path is due now (planning again if the robot fell behind)'''
+    def on_schedule(self):
+        now = self.reservations.now
+        if now > self.schedule[0]:
+            # Held up past its reservations (e.g. by the warehouse wait): plan the rest of the leg again from here
+            goal = self.orders_queue[0].location if self.orders_queue else self.warehouses.nearest(self.position)
+            path = self.route(goal, now) if goal else None
+            self.path = path[1:] if path else []
+            if not self.path:
+                return False
+        return now >= self.schedule[0]
 
     '''This method is called after a robot finishes its current path. It determines what the robot should do next. '''
     def proceed_to_next_task(self):
+        if self.awaiting_plan is not None:
+            return
+        if self.orders_queue and self.position != self.orders_queue[0].location:
+            # The path ended early (no route was found or the map changed): try to reach the order again
+            path = self.route(self.orders_queue[0].location)
+            if path:
+                self.path = path[1:]
+            return
         if self.orders_queue:
-            completed_order = self.orders_queue.pop(0)      # Remove the completed order
-            completed_order['delivered'] = True             # Mark as delivered
-            completed_order['delivered_time'] = pygame.time.get_ticks()
-            delivery_time = (pygame.time.get_ticks() - completed_order.get('created_time', 0)) // 1000   # Cal how long the order took to get delivered
+            completed_order = self.orders_queue.popleft()   # Remove the completed order
+            self.order_store.mark_delivered(completed_order, self.clock.get_ticks())                     # Mark as delivered
+            delivery_time = (self.clock.get_ticks() - completed_order.created_time) // 1000             # Cal how long the order took to get delivered
             self.total_delivery_time += delivery_time       # Add to delivery time
             self.deliveries += 1                            # Add delivery count
-            next_target = self.orders_queue[0]['location'] if self.orders_queue else FW_LOCATION         # Next location
+            next_target = self.orders_queue[0].location if self.orders_queue else self.warehouses.nearest(self.position)   # Next location
             
-            #NOTE :For testing different pathfindings, we can easily call them here 
-            path = astar(self.grid, self.position, next_target)                                          # Path to next location
+            #NOTE :For testing different pathfindings, pass planner='jps', 'bfs', ... to the Simulation
+            path = self.route(next_target) if next_target else None                                    # Path to next location
 
             if path:
                 self.path = path[1:]
             else:
                 print(f"[ERROR] Robot {self.robot_id} cannot find path to {next_target} from {self.position}")
         else:
-            if self.position != FW_LOCATION:
-                
-                #NOTE :For testing different pathfindings, we can easily call them here 
-                path = astar(self.grid, self.position, FW_LOCATION)
+            if self.position not in self.warehouses:
+                home = self.warehouses.nearest(self.position)           # Nearest warehouse, looked up in the precomputed table
+
+                #NOTE :For testing different pathfindings, pass planner='jps', 'bfs', ... to the Simulation
+                path = self.route(home) if home else None
 
                 if path:
                     self.path = path[1:]
-                self.busy = True
+                self.set_busy(True)
             else:
-                self.busy = False
+                self.set_busy(False)
+
+    '''Repairs the current path after map cells changed, reusing the previous search when possible'''
+    def replan(self, changed_cells):
+        if self.reservations is not None:
+            if any(self.grid[cell] != 0 for cell in self.path):
+                self.path = []                               # Planned again, with reservations, on the next move
+                self.schedule = deque()
+            return
+        if not self.path:
+            self.replanner = None                            # Its distances would miss this change
+            return
+        goal = self.path[-1]
+        if self.replanner is None or self.replanner.goal != goal:
+            self.replanner = None
+            if not any(self.grid[cell] != 0 for cell in self.path):
+                return                                       # Path still valid: no need to search yet
+            self.replanner = DStarLite(self.grid, self.position, goal)
+        else:
+            self.replanner.move_to(self.position)
+            self.replanner.update_cells(changed_cells)
+        path = self.replanner.path()
+        if path:
+            self.path = path[1:]
+        else:
+            print(f"[WARNING] Robot {self.robot_id} is cut off from {goal}, waiting for the map to change")
+            self.path = []
 
-    '''Scans a 5x5 square centered on the robot to find the Manhattan distance to the closest obstacle '''    
+    '''Distance to the closest obstacle in the 5x5 square centered on the robot, looked up in the precomputed clearance map '''    
     def distance_to_nearest_obstacle(self):
-        x, y = self.position
-        min_dist = float('inf')
-        for i in range(max(0, x-2), min(len(self.grid), x+3)):              # Bounds doesn't exceed the grid size
-            for j in range(max(0, y-2), min(len(self.grid[0]), y+3)):       # Bounds doesn't exceed the grid size
-                if self.grid[i][j] == 1:
-                    dist = np.sqrt(((i - x )**2)+((j-y)**2))
-                    #dist = abs(i - x) + abs(j - y)
-                    if dist < min_dist:
-                        min_dist = dist
-        return min_dist
+        return float(self.clearance.distance[self.position])
     
     '''Chooses a speed mode based on how close the robot is to an obstacle '''
     def get_speed_mode(self):
-        dist = self.distance_to_nearest_obstacle()
-        if dist <= 1:
-            return "cautious"  # slow
-        elif dist <= 3:
-            return "normal"    # medium
-        else:
-            return "fast"      # fast
+        return speed_mode(self.distance_to_nearest_obstacle())
         
     '''Controls how the robot moves in each simulation tick '''
     def move(self):
         if self.at_warehouse and not self.path and not self.waiting:         # If robot is at warehouse and idle, begin waiting
             self.waiting = True
-            self.wait_start_time = pygame.time.get_ticks()                   # Start waiting timer
+            self.wait_start_time = self.clock.get_ticks()                    # Start waiting timer
 
         if self.waiting:
-            if pygame.time.get_ticks() - self.wait_start_time >= 1000:       # Wait 1.5 seconds (1000 milliseconds)
+            if self.clock.get_ticks() - self.wait_start_time >= WAREHOUSE_WAIT_MS:    # Wait 1 second (1000 milliseconds)
                 self.waiting = False
                 self.at_warehouse = False                                    # Done waiting
             else:
                 return                                                       # Still waiting, do nothing
-        # Check speed mode :    
-        mode = self.get_speed_mode()
-        speed_map = {"cautious": 3, "normal": 2, "fast": 1}  # Delay in ticks
-        if self.move_delay < speed_map[mode]:
+        # Check speed mode (delay in ticks, precomputed per cell) :    
+        if self.move_delay < self.clearance.delay[self.position]:
             self.move_delay += 1
             return
+        if self.schedule and not self.on_schedule():
+            return                                                           # Cooperative: hold until the next cell is due
         self.move_delay = 0
 
         # Standard movement logic :
         if self.path:
             self.position = self.path.pop(0)
+            if self.schedule:
+                self.schedule.popleft()
 
         if not self.path:
             self.proceed_to_next_task()
 
         # Check if robot is back at warehouse
-        if self.position == FW_LOCATION and not self.orders_queue:
+        if self.position in self.warehouses and not self.orders_queue:
             self.at_warehouse = True
 
 """Handles the whole simulation loop, screen drawing, event handling, and robot coordination.
 
 """
 class Simulation:
-    def __init__(self, grid, orders, robots):
-        pygame.init()                                       # Initialize all pygame modules
+    def __init__(self, grid, orders, robots, headless=False, clock=None, route_optimizer='auto', planner='astar',
+                 vectorized=False, background_planning=False, assignment_workers=0, assignment='greedy',
+                 seed=None, max_orders_per_robot=MAX_ORDERS_PER_ROBOT, instrument=False, metrics_path=None,
+                 order_source=None, trace=None, tables=None, warehouses=None, cooperative=False,
+                 sla_path=None, sla_interval=EXPORT_INTERVAL_MS):
+        if cooperative and (vectorized or background_planning):
+            raise ValueError("Cooperative planning holds Robot objects to their reservations, run it without vectorized or background planning")
+        if background_planning and assignment_workers:
+            raise ValueError("Background planning runs assignment rounds on its own worker thread, run it without assignment workers")
         self.grid = grid                                    # Store the warehouse map
-        self.orders = orders                                # List of all current orders
+        locations = warehouses or (tables.warehouses if tables else WAREHOUSES)
+        # Every warehouse plus the nearest one to each cell, from one multi-source flood fill (or the map file)
+        self.warehouses = Warehouses(grid, locations, tables and tables.nearest_tables(locations))
+        for order in orders:
+            order.warehouse_distance = float(self.warehouses.straight[order.location])
+        self.orders = OrderStore(grid, orders, len(self.warehouses))    # All current orders, indexed by state and location
         self.robots = robots                                # List of all robot 
-        self.screen = pygame.display.set_mode((MAP_SIZE * CELL_SIZE, MAP_SIZE * CELL_SIZE + 120))       # Create a display window
-        pygame.display.set_caption("FOODIE Simulation")     # Set the window title
-        self.clock = pygame.time.Clock()                    # Create a clock to manage the frame rate
-        self.start_time = pygame.time.get_ticks()           # Time when simulation started (in ms)
+        self.headless = headless                            # Run without a window (no pygame display)
+        if headless:
+            self.screen = None
+            self.font = None
+            self.renderer = None
+            self.clock = clock or VirtualClock()            # Simulated time, advanced as fast as the CPU allows
+        else:
+            pygame.init()                                   # Initialize all pygame modules
+            cell_size = cell_size_for(grid.shape)
+            self.screen = pygame.display.set_mode((grid.shape[1] * cell_size, grid.shape[0] * cell_size + PANEL_HEIGHT))    # Create a display window
+            pygame.display.set_caption("FOODIE Simulation") # Set the window title
+            self.clock = clock or PygameClock()             # Create a clock to manage the frame rate
+            self.font = pygame.font.SysFont(None, 18)       # GUI font used
+            self.renderer = GridRenderer(self.screen, grid, self.warehouses, cell_size)    # Static map pre-rendered, cells redrawn when they change
+        self.start_time = self.clock.get_ticks()            # Time when simulation started (in ms)
         self.elapsed_seconds = 0                            # How long the simulation has been running
         self.order_id_counter = len(orders) + 1             # Generating unique order IDs
-        self.font = pygame.font.SysFont(None, 18)           # GUI font used
+        self.distances = DistanceOracle(grid)               # Cached distance fields for batch assignment
+        self.clearance = (tables and tables.clearance_map()) or ClearanceMap(grid)     # Obstacle clearance and speed delay per cell
+        self.planner = PLANNERS[planner] if isinstance(planner, str) else planner   # 'astar', 'jps', 'bfs', 'dfs', 'dijkstra' or a function
+        if tables:
+            # Distance fields and, for the HPA* planner, its clusters saved with the map (mapfile.MapFile)
+            tables.preload(self.distances, clusters=self.planner is PLANNERS['hpa'])
+        self.route_optimizer = route_optimizer              # 'auto', 'held_karp', 'insertion' or a callable, see routing.py
+        self.assignment = assignment                        # 'greedy' or 'optimal', see assignment.pair_groups
+        self.max_orders_per_robot = max_orders_per_robot    # Largest batch a robot takes at once
+        self.rng = random.Random(seed) if seed is not None else random  # Order locations; seeded runs are reproducible
+        self.order_cells = ReachableCells(grid, self.warehouses, [order.location for order in self.orders])  # Where new orders can go
+        # Space-time reservations: robots plan around each other and never share a cell (outside the warehouses)
+        self.reservations = ReservationTable(grid, self.clearance, self.warehouses) if cooperative else None
+        # Wait, assignment and delivery latency and fleet utilization histograms, logged to `sla_path` if set
+        self.sla = ServiceMetrics(sla_path, sla_interval)
+        self.orders.metrics = self.sla
         for robot in self.robots:
             robot.grid = self.grid                          # Access to the shared grid
+            robot.clock = self.clock                        # Access to the shared time source
+            robot.order_store = self.orders                 # Robots report deliveries to the store
+            robot.clearance = self.clearance                # Speed mode lookups
+            robot.warehouses = self.warehouses              # Return to the nearest warehouse
+            robot.planner = self.planner                    # Same pathfinding for every robot
+            robot.reservations = self.reservations
+            robot.sla = self.sla
+            self.sla.busy_robots += robot.busy
+            if self.reservations:
+                self.reservations.park(robot.robot_id, robot.position)  # Nobody plans through a robot standing still
+        # Move the robots as NumPy arrays instead of one Robot.move() call each (for large fleets)
+        self.fleet = Fleet(self.robots, grid, self.clearance, self.clock, self.warehouses) if vectorized else None
+        # Plan assignment rounds and replans on a worker thread, committing them at the start of a tick
+        self.planning = PlanningService(grid, self.planner, route_optimizer, max_orders_per_robot,
+                                        assignment) if background_planning else None
+        # Route the batches of an assignment round in a pool of worker processes
+        self.parallel = ParallelPlanner(grid, assignment_workers, route_optimizer) if assignment_workers else None
+        # Per-phase tick timers and search counters, shown under the stats panel and exported at the end of run()
+        self.metrics = Instrumentation(enabled=instrument or metrics_path is not None)
+        self.metrics_path = metrics_path                    # JSON file written by run(), if any
+        self.order_source = order_source                    # Streamed orders (streaming.OrderSource) instead of random ones
+        self.trace = trace                                  # streaming.TraceRecorder of the orders and assignments, if any
+        self.rejected_orders = 0                            # Streamed orders dropped for landing on an unusable cell
 
     '''Assign orders to idle robots at the warehouse'''
     def assign_orders_in_batch(self):
-        # Filter unassigned orders
-        unassigned = [o for o in self.orders if not o['assigned']]
-        '''Smart priority: older and closer to warehouse = higher score'''
-        def order_priority(order):
-            age = (pygame.time.get_ticks() - order.get('created_time', 0)) // 1000      # How many seconds the order was created.
-            dx = order['location'][0] - FW_LOCATION[0]                                  # Horizontal distance from warehouse
-            dy = order['location'][1] - FW_LOCATION[1]                                  # Vertical distance from warehouse
-            dist = (dx * dx + dy * dy) ** 0.5                                           # Euclidean distance
-            return (age*1.5) - dist                                                     # higher = better (older with stronger bias & closer)
-        
-        unassigned.sort(key=order_priority, reverse=True)                               # Sort unassigned orders by smart score
-        for robot in [r for r in self.robots if r.at_warehouse and not r.busy]:         # Loop through robots that are currently idle at the warehouse
-            if not unassigned:
-                break
-            base_order = unassigned.pop(0)                                              # Take one order and try to find nearby ones
-            group = [base_order]                                                        # Build a group of nearby orders
-            base_order['assigned'] = True                                               # mark it early too
-            
-            # Group nearby orders up to MAX
-            for other in unassigned[:]:
-                if other['assigned']:
-                    continue                                                            # skip already taken orders
-                dx = base_order['location'][0] - other['location'][0]
-                dy = base_order['location'][1] - other['location'][1]
-                if dx * dx + dy * dy <= 25:                                             # Within 5x5 range (squared distance ≤ 25)
-                    group.append(other)
-                    other['assigned'] = True                                            # pre-assign to lock it
-                    unassigned.remove(other)
-                    if len(group) == MAX_ORDERS_PER_ROBOT:
-                        break
-
-            # Try all permutations of the order group and pick the shortest total path
-            best_order_sequence = None
-            best_total_distance = float('inf')
-
-            for perm in permutations(group):
-                total_distance = 0
-                last_pos = robot.position
-                valid = True
-                for order in perm:
-
-                    #NOTE :For testing different pathfindings, we can easily call them here 
-                    path = astar(self.grid, last_pos, order['location'])
-
-                    if not path:
-                        valid = False
-                        break
-                    total_distance += len(path)
-                    last_pos = order['location']
-                if valid and total_distance < best_total_distance:
-                    best_total_distance = total_distance
-                    best_order_sequence = perm
-
-            # Assign orders in optimal sequence
-            if best_order_sequence:
-                last_pos = robot.position
-                for order in best_order_sequence:
-
-                    #NOTE :For testing different pathfindings, we can easily call them here 
-                    path = astar(self.grid, last_pos, order['location'])
-
+        if self.fleet:
+            idle = self.fleet.idle()
+        else:
+            idle = [i for i, r in enumerate(self.robots) if r.at_warehouse and not r.busy]  # Robots idle at the warehouse
+        robots = list(zip(idle, self.fleet.positions(idle))) if self.fleet else [(i, self.robots[i].position) for i in idle]
+        if self.planning:
+            if robots and self.orders.unassigned and not self.planning.busy('assign'):
+                self.planning.submit_assignment(self.orders.unassigned.values(), robots, self.clock.get_ticks(),
+                                                self.orders.index.snapshot())
+            return
+        started = time.perf_counter()
+        if self.parallel:
+            batches = self.parallel.plan_batches(list(self.orders.unassigned.values()), robots, self.clock.get_ticks(),
+                                                 self.distances, self.max_orders_per_robot, mode=self.assignment,
+                                                 index=self.orders.index.snapshot())
+        else:
+            batches = plan_batches(list(self.orders.unassigned.values()), robots, self.clock.get_ticks(),
+                                   self.distances, self.route_optimizer, self.max_orders_per_robot, mode=self.assignment,
+                                   index=self.orders.index.snapshot())
+        self.sla.assignment_round(time.perf_counter() - started)
+        self.commit_batches(batches)
+
+    '''Hand the planned batches to their robots'''
+    def commit_batches(self, batches):
+        taken = [batch.robot for batch in batches if batch.sequence]
+        if self.fleet:
+            self.fleet.to_robots(taken)                                                 # Only the robots given orders leave the arrays
+        now = self.clock.get_ticks()
+        for batch in batches:
+            for order in batch.group:
+                self.orders.mark_assigned(order, now)                                   # lock every order of the group
+            if batch.sequence:
+                robot = self.robots[batch.robot]
+                for path, order in zip(batch.paths, batch.sequence):                   # Assign orders in optimal sequence
                     robot.add_order(path, order)
-                    order['assigned'] = True
-                    last_pos = order['location']
-                print(f"[INFO] Robot {robot.robot_id} assigned orders {[o['order_id'] for o in best_order_sequence]}")
+                print(f"[INFO] Robot {robot.robot_id} assigned orders {[o.order_id for o in batch.sequence]}")
+                if self.trace:
+                    self.trace.assignment(self.clock.get_ticks() - self.start_time, robot.robot_id,
+                                          [o.order_id for o in batch.sequence])
+        if self.fleet:
+            self.fleet.from_robots(taken)
+
+    '''Commit the background plans that finished, skipping batches whose robot or orders moved on meanwhile'''
+    def commit_plans(self):
+        for kind, key, result in self.planning.finished():
+            if kind == 'assign':
+                self.commit_batches([batch for batch in result if self._batch_still_valid(batch)])
+                continue
+            if self.fleet:
+                self.fleet.to_robots((key,))
+            robot = self.robots[key]
+            start = robot.path[-1] if robot.path else robot.position
+            if robot.awaiting_plan is not None:
+                if result and result[0] == start:
+                    robot.path = robot.path + result[1:]                                # Carry on past where it stopped
+                else:
+                    print(f"[WARNING] Robot {robot.robot_id} got no path to {robot.awaiting_plan}, retrying")
+                robot.awaiting_plan = None
+            if self.fleet:
+                self.fleet.from_robots((key,))
+
+    '''Whether a batch planned in the background can still be handed to its robot
+
+    It is stale once its robot got busy or left the cell it was planned from, or once any of its
+    orders was taken by another batch. Rounds planned before a map change never get here: the
+    planning service drops them (PlanningService.finished()).
+    '''
+    def _batch_still_valid(self, batch):
+        if self.fleet:
+            busy = self.fleet.busy[batch.robot]
+            position = self.fleet.positions([batch.robot])[0]
+        else:
+            busy = self.robots[batch.robot].busy
+            position = self.robots[batch.robot].position
+        return (not busy and position == batch.start and
+                all(order.order_id in self.orders.unassigned for order in batch.group))
+
+    '''Generates a random, valid order: on a free cell reachable from the warehouse with no order on it
 
-    '''Generates a random, valid order'''
+    Returns None if no such cell is left.
+    '''
     def generate_order(self):
-        existing_locations = {order['location'] for order in self.orders}  # Collect all current order locations
-        while True:
-            x, y = random.randint(0, MAP_SIZE - 1), random.randint(0, MAP_SIZE - 1)
-
-            #NOTE :For testing different pathfindings, we can easily call them here 
-            if (
-                self.grid[x][y] == 0 and                      # Not an obstacle
-                (x, y) != FW_LOCATION and                     # Not the warehouse
-                (x, y) not in existing_locations and          # Not already taken by another order
-                astar(self.grid, FW_LOCATION, (x, y))         # Must be reachable
-            ):
-                return {
-                    'order_id': self.order_id_counter,
-                    'location': (x, y),
-                    'assigned': False,
-                    'delivered': False,
-                    'created_time': pygame.time.get_ticks()
-                }
+        location = self.order_cells.sample(self.rng)
+        if location is None:
+            return None
+        return Order(self.order_id_counter, location, self.clock.get_ticks())
+
+    '''Up to `n` random, valid orders on distinct cells, numbered from the next order ID'''
+    def generate_orders(self, n):
+        now = self.clock.get_ticks()
+        return [Order(self.order_id_counter + i, location, now)
+                for i, location in enumerate(self.order_cells.sample_many(self.rng, n))]
     """Old Version  
     '''Assign a specific new order'''
     def assign_order(self, order):
@@ -295,73 +441,129 @@ class Simulation:
         return False
     """
 
-    '''Determine if 80% of free map cells are occupied by active orders'''
-    def too_many_orders(self):
-        total_cells = MAP_SIZE * MAP_SIZE
-        obstacle_cells = np.sum(self.grid == 1)
-        warehouse_cell = 1
-        free_cells = total_cells - obstacle_cells - warehouse_cell
+    '''Generates a new order, numbers it and adds it to the active orders'''
+    def create_order(self):
+        order = self.generate_order()
+        if order is None:
+            print("[WARNING] No free cell reachable from the warehouse! Skipping order generation.")
+            return None
+        self._add_order(order)
+        return order
+
+    '''Generates up to `n` new orders at once (e.g. to pre-fill the map) and adds them to the active orders'''
+    def create_orders(self, n):
+        orders = self.generate_orders(n)
+        for order in orders:
+            self._add_order(order)
+        return orders
+
+    def _add_order(self, order):
+        order.order_id = self.order_id_counter
+        order.warehouse_distance = float(self.warehouses.straight[order.location])
+        self.orders.add(order)
+        self.order_cells.take(order.location)
+        self.order_id_counter += 1
+        if self.trace:
+            self.trace.order(self.clock.get_ticks() - self.start_time, order)
+
+    '''Add the streamed orders that are due, while the map is not crowded; the others wait in the source'''
+    def ingest_orders(self):
+        now = self.clock.get_ticks()
+        while not self.too_many_orders():
+            record = self.order_source.next_due(now - self.start_time)
+            if record is None:
+                break
+            location = record[1]
+            if location not in self.order_cells:
+                print(f"[WARNING] Streamed order at {location} is off the map or not a free cell reachable from a warehouse, dropping it")
+                self.rejected_orders += 1
+                continue
+            self._add_order(Order(self.order_id_counter, location, now))
+
+    '''Block or unblock one map cell at runtime'''
+    def set_obstacle(self, cell, blocked=True):
+        return self.update_cells({cell: blocked})
+
+    '''Apply runtime map changes {cell: blocked} and let the affected robots repair their paths'''
+    def update_cells(self, changes):
+        h, w = self.grid.shape
+        if self.fleet:
+            self.fleet.to_robots()
+        occupied = {robot.position for robot in self.robots}
+        changed = []
+        for cell, blocked in changes.items():
+            if not (0 <= cell[0] < h and 0 <= cell[1] < w):
+                print(f"[WARNING] Cell {cell} is outside the map")
+                continue
+            if blocked and (cell in self.warehouses or cell in occupied or self.orders.is_occupied(cell)):
+                print(f"[WARNING] Cell {cell} holds the warehouse, a robot or an order and cannot be blocked")
+                continue
+            if bool(self.grid[cell]) == blocked:
+                continue
+            self.grid[cell] = 1 if blocked else 0
+            self.orders.obstacle_changed(blocked)
+            self.clearance.update(cell)
+            changed.append(cell)
+        if not changed:
+            return False
 
-        active_orders = len([order for order in self.orders if not order.get('delivered')])
+        # Repair or drop everything derived from the old map, then repair robot paths incrementally
+        grid_changed(self.grid, changed)
+        hierarchical.cells_changed(self.grid, changed)
+        self.distances.invalidate(changed)
+        self.warehouses.update_cells(changed)
+        for order in self.orders:                           # The nearest warehouse of an order may have changed
+            order.warehouse_distance = float(self.warehouses.straight[order.location])
+        self.order_cells.rebuild([order.location for order in self.orders])
+        if self.renderer:
+            self.renderer.cells_changed(changed)
+        if self.parallel:
+            self.parallel.update_cells({cell: bool(self.grid[cell]) for cell in changed})
+        if self.planning:
+            self.replan_in_background(changed)
+        else:
+            for robot in self.robots:
+                robot.replan(changed)
+        if self.fleet:
+            self.fleet.from_robots()
+        return True
+
+    '''Stop robots short of newly blocked cells and have the worker plan the rest of their way'''
+    def replan_in_background(self, changed):
+        self.planning.update_cells({cell: bool(self.grid[cell]) for cell in changed})
+        for i, robot in enumerate(self.robots):
+            blocked = next((k for k, cell in enumerate(robot.path) if self.grid[cell] != 0), None)
+            if blocked is not None:
+                robot.awaiting_plan = robot.path[-1]
+                del robot.path[blocked:]
+            if robot.awaiting_plan is not None:                                         # Earlier plans are stale now
+                start = robot.path[-1] if robot.path else robot.position
+                self.planning.submit_replan(i, start, robot.awaiting_plan)
 
-        if active_orders >= 0.8 * free_cells:
+    '''Determine if 80% of free map cells are occupied by active orders'''
+    def too_many_orders(self):
+        if self.orders.active_count >= 0.8 * self.orders.free_cells:     # Both counters are kept up to date by the store
             return True
         return False
 
-    '''Draws the grid, robots, and order states'''
+    '''Draws the grid, robots, and order states; returns the screen rectangles that changed'''
     def draw_grid(self):
-        self.screen.fill((255, 255, 255))
-        for x in range(MAP_SIZE):
-            for y in range(MAP_SIZE):
-                rect = pygame.Rect(y * CELL_SIZE, x * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                if self.grid[x][y] == 1:
-                    pygame.draw.rect(self.screen, OBSTACLE_COLOR, rect)
-                else:
-                    pygame.draw.rect(self.screen, GRID_COLOR, rect, 1)
-
-        # Draw warehouse
-        wx, wy = FW_LOCATION
-        pygame.draw.rect(self.screen, WAREHOUSE_COLOR, (wy * CELL_SIZE, wx * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-
-        # Draw orders
-        orders_to_remove = []
-        for order in self.orders:
-            ox, oy = order['location']
-            if order.get('delivered'):
-                color = DELIVERED_ORDER_COLOR
-                if pygame.time.get_ticks() - order.get('delivered_time', 0) > 2000:
-                    orders_to_remove.append(order)
-                    continue 
-            elif order.get('assigned'):
-                color = ASSIGNED_ORDER_COLOR
-            else:
-                # Unassigned - darken gray over time
-                age = (pygame.time.get_ticks() - order.get('created_time', 0)) // 1000  # seconds
-                shade = max(50, 150 - age * 10)  # gets darker every 1s, stops at 50
-                color = (shade, shade, shade)
-            pygame.draw.circle(self.screen, color, (oy * CELL_SIZE + 15, ox * CELL_SIZE + 15), 10)
-
-        # Remove delivered orders from the main list
-        for order in orders_to_remove:
-            self.orders.remove(order)
-
-        # Draw robots
-        for robot in self.robots:
-            rx, ry = robot.position
-            pygame.draw.rect(self.screen, ROBOT_COLOR, (ry * CELL_SIZE + 5, rx * CELL_SIZE + 5, 20, 20))
+        rects = self.renderer.draw(self.orders, self.robots, self.clock.get_ticks())
 
         info_text = self.font.render(f"Orders Generated: {self.order_id_counter - 1}", True, (0, 0, 0))
-        self.screen.blit(info_text, (10, MAP_SIZE * CELL_SIZE + 10))
+        self.screen.blit(info_text, (10, self.renderer.height + 10))
         
         # Draw stats
         self.draw_stats_panel()
+        rects.append(pygame.Rect(0, self.renderer.height, self.renderer.width, PANEL_HEIGHT))
+        return rects
         
     '''Displays delivery stats below the grid'''
     def draw_stats_panel(self):
-        panel_top = MAP_SIZE * CELL_SIZE + 10
+        panel_top = self.renderer.height + 10
         line_height = 22
         padding = 10
-        elapsed_ms = pygame.time.get_ticks() - self.start_time
+        elapsed_ms = self.clock.get_ticks() - self.start_time
         elapsed_sec = elapsed_ms // 1000
 
 
@@ -369,7 +571,7 @@ class Simulation:
         pygame.draw.rect(
             self.screen,
             (240, 240, 240),  # light gray background
-            (0, MAP_SIZE * CELL_SIZE, MAP_SIZE * CELL_SIZE, 110)
+            (0, self.renderer.height, self.renderer.width, PANEL_HEIGHT)
         )
 
         # Combined title + total + delivered
@@ -387,47 +589,150 @@ class Simulation:
             text = self.font.render(stats_line, True, (0, 0, 0))
             self.screen.blit(text, (padding, panel_top + line_height * (i + 1)))
 
+        # Latency percentiles in the middle third of the panel
+        for i, line in enumerate(self.sla.overlay_lines()):
+            text = self.font.render(line, True, (160, 80, 40))
+            self.screen.blit(text, (self.renderer.width // 3, panel_top + line_height * (i + 1)))
+
+        # Slowest phases of the recent ticks, in the right third of the panel
+        if self.metrics.enabled:
+            for i, line in enumerate(self.metrics.overlay_lines()):
+                text = self.font.render(line, True, (80, 80, 160))
+                self.screen.blit(text, (2 * self.renderer.width // 3, panel_top + line_height * (i + 1)))
+
+    '''A new order comes in, unless the map is already crowded with active orders'''
+    def order_arrival(self):
+        if not self.too_many_orders():
+            self.create_order()
+        else:
+            print("[WARNING] Too many active orders! Skipping order generation.")
+
+    '''Drop delivered orders once they have been shown in green for 2 seconds'''
+    def remove_expired_orders(self):
+        expired = self.orders.expire_delivered(self.clock.get_ticks())
+        for order in expired:
+            self.order_cells.release(order.location)
+        return expired
+
+    '''Advance the simulation by one tick: order generation, batch assignment and robot movement'''
+    def tick(self):
+        metrics = self.metrics
+        with metrics.phase('tick'):
+            self.elapsed_seconds += 1
+            if self.reservations:
+                self.reservations.advance(self.elapsed_seconds)
+            if self.planning:
+                with metrics.phase('plans'):
+                    self.commit_plans()
+
+            # Streamed orders come in as they fall due, otherwise generate one new order every 10 seconds
+            if self.order_source:
+                with metrics.phase('orders'):
+                    self.ingest_orders()
+            elif self.elapsed_seconds % 10 == 0:
+                with metrics.phase('orders'):
+                    self.order_arrival()
+
+            # On the next tick, assign any unassigned orders in batch
+            if self.elapsed_seconds % 10 == 1:
+                with metrics.phase('assignment'):
+                    self.assign_orders_in_batch()
+            # Move all robots
+            with metrics.phase('move'):
+                if self.fleet:
+                    self.fleet.step()
+                else:
+                    for robot in self.robots:
+                        robot.move()
+            busy = np.count_nonzero(self.fleet.busy) if self.fleet else self.sla.busy_robots
+            self.sla.fleet_busy(busy, len(self.robots))
+            self.sla.tick(self.clock.get_ticks() - self.start_time)
+            with metrics.phase('expire'):
+                self.remove_expired_orders()
+
+    '''Run n ticks without drawing, advancing the clock as fast as possible'''
+    def step(self, n=1):
+        for _ in range(n):
+            if self.planning:
+                self.planning.wait()        # Plans land on the tick after their submission, as fast as the worker goes
+            self.clock.tick()
+            self.tick()
+
+    '''Simulate `duration` seconds of simulated time headlessly and return the delivery stats'''
+    def run_headless(self, duration):
+        end_time = self.start_time + duration * 1000
+        while self.clock.get_ticks() < end_time:
+            self.step()
+        return self.get_stats()
+
+    '''Summary of the delivery stats so far'''
+    def get_stats(self):
+        elapsed_ms = self.clock.get_ticks() - self.start_time
+        return {
+            'elapsed_seconds': elapsed_ms // 1000,
+            'total_orders': self.order_id_counter - 1,
+            'delivered_orders': sum(robot.deliveries for robot in self.robots),
+            'robots': {
+                robot.robot_id: {
+                    'deliveries': robot.deliveries,
+                    'avg_delivery_time': robot.total_delivery_time / robot.deliveries if robot.deliveries else 0,
+                }
+                for robot in self.robots
+            },
+        }
+
+    '''Print the delivery stats to the console'''
+    def print_stats(self):
+        stats = self.get_stats()
+        print("\n==== DELIVERY STATS ====")
+        print(f"Total Simulation Time: {stats['elapsed_seconds']} seconds")
+        print(f"Total Delivered Orders: {stats['delivered_orders']}")
+        for robot_id, robot_stats in stats['robots'].items():
+            print(f"{robot_id}: {robot_stats['deliveries']} deliveries, avg time = {robot_stats['avg_delivery_time']:.2f} sec")
+        for name, summary in self.sla.report().items():
+            print(f"{name}: p50 = {summary['p50']:.2f}, p95 = {summary['p95']:.2f}, p99 = {summary['p99']:.2f} ({summary['count']} samples)")
+
+    '''Write the phase timers, search counters and delivery stats to `path` as JSON'''
+    def export_metrics(self, path):
+        self.metrics.export(path, ticks=self.elapsed_seconds, robots=len(self.robots), stats=self.get_stats(),
+                            sla=self.sla.report())
+
+    '''Stop the planning workers, close the order source and trace, if any, and write the last SLA line'''
+    def close(self):
+        self.sla.close(self.clock.get_ticks() - self.start_time)
+        if self.planning:
+            self.planning.close()
+        if self.parallel:
+            self.parallel.close()
+        if self.order_source:
+            self.order_source.close()
+        if self.trace:
+            self.trace.close()
+
     '''Main simulation loop'''
     def run(self):
         running = True
         while running:
             # Limit the simulation to 20 frames (ticks) per second
             self.clock.tick(20)             
-            self.elapsed_seconds += 1
 
             # Exit the loop if the user closes the window
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
 
-            # Every 10 seconds, generate one new order
-            if self.elapsed_seconds % 10 == 0:
-                if not self.too_many_orders():
-                    new_order = self.generate_order()
-                    new_order['order_id'] = self.order_id_counter
-                    self.orders.append(new_order)
-                    self.order_id_counter += 1
-                else:
-                    print("[WARNING] Too many active orders! Skipping order generation.")
-
-            # On the next tick, assign any unassigned orders in batch
-            if self.elapsed_seconds % 10 == 1:
-                self.assign_orders_in_batch()
-            # Move all robots
-            for robot in self.robots:
-                robot.move()
-            # Redraw the entire screen: grid, robots, orders, warehouse, and stats
-            self.draw_grid()
-            # Update the visual display with what's been drawn
-            pygame.display.flip()
+            self.tick()
+            with self.metrics.phase('draw'):
+                if self.fleet:
+                    self.fleet.to_robots()      # Robot positions for drawing
+                # Redraw what changed: robots, orders and stats over the pre-rendered map
+                rects = self.draw_grid()
+                # Update only the changed parts of the display
+                pygame.display.update(rects)
         # After simulation ends, print stats to console
-        print("\n==== DELIVERY STATS ====")
-        elapsed_ms = pygame.time.get_ticks() - self.start_time
-        elapsed_sec = elapsed_ms // 1000
-        print(f"Total Simulation Time: {elapsed_sec} seconds")
-        print(f"Total Delivered Orders: {sum(robot.deliveries for robot in self.robots)}")
-        for robot in self.robots:
-            avg_time = robot.total_delivery_time / robot.deliveries if robot.deliveries else 0
-            print(f"{robot.robot_id}: {robot.deliveries} deliveries, avg time = {avg_time:.2f} sec")
+        self.print_stats()
+        if self.metrics_path:
+            self.export_metrics(self.metrics_path)
+        self.close()
         pygame.quit()
         sys.exit()
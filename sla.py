@@ -0,0 +1,179 @@
+import json
+import math
+from array import array
+import numpy as np
+
+SIGNIFICANT_FIGURES = 2               # Histogram values are kept to within 1% (two significant digits)
+PERCENTILES = (50, 95, 99)
+EXPORT_INTERVAL_MS = 10000            # Simulated time between two lines of the SLA log
+
+
+"""Fixed-memory streaming histogram of non-negative integers, HDR-style
+
+Values below 2 * 10^significant_figures (rounded up to a power of two) get a bucket each; above,
+every power of two is split into the same number of linear sub-buckets, so a value lands in a bucket
+less than 1% wide (two significant figures) whatever its magnitude. Memory is fixed by `highest`
+(a few KB), record() is a handful of integer operations, and percentiles are read off a cumulative
+sum of the counts. Values above `highest` are counted as `highest`.
+"""
+class Histogram:
+    __slots__ = ('highest', 'bits', 'sub_count', 'half', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, highest, significant_figures=SIGNIFICANT_FIGURES):
+        self.highest = int(highest)
+        self.bits = max(2, math.ceil(math.log2(2 * 10 ** significant_figures)))    # Bits of a sub-bucket index
+        self.sub_count = 1 << self.bits                 # Exact buckets below this value
+        self.half = self.sub_count >> 1                 # Sub-buckets per power of two above it
+        buckets = max(0, self.highest.bit_length() - self.bits)
+        self.counts = array('q', bytes(8 * (self.sub_count + buckets * self.half)))
+        self.count = 0                  # Values recorded
+        self.total = 0                  # Their sum, for the mean
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.bits
+        return self.sub_count + (shift - 1) * self.half + (value >> shift) - self.half
+
+    # Largest value that lands in bucket `index`
+    def _value(self, index):
+        if index < self.sub_count:
+            return index
+        bucket, sub = divmod(index - self.sub_count, self.half)     # Power of two above sub_count, sub-bucket in it
+        return ((sub + self.half + 1) << (bucket + 1)) - 1
+
+    '''Count `value` (`n` times)'''
+    def record(self, value, n=1):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += n
+        self.count += n
+        self.total += value * n
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    '''Copy of the bucket counts, to diff a later snapshot against'''
+    def snapshot(self):
+        return np.array(self.counts, dtype=np.int64)
+
+    '''Value at percentile `p` (0-100) of the counts (all of them, or `counts` since an earlier snapshot)'''
+    def percentile(self, p, counts=None):
+        if counts is None:
+            counts = np.frombuffer(self.counts, dtype=np.int64)
+        cumulative = np.cumsum(counts)
+        if not len(cumulative) or cumulative[-1] == 0:
+            return 0
+        rank = max(1, math.ceil(p / 100 * cumulative[-1]))
+        value = self._value(int(np.searchsorted(cumulative, rank)))
+        return min(value, self.max) if self.max is not None else value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    '''count, mean, min, max and the PERCENTILES as a dict, scaled by `scale` (e.g. 1/1000 for ms -> s)'''
+    def summary(self, scale=1, counts=None):
+        if counts is not None:
+            return {'count': int(counts.sum()),
+                    **{f'p{p}': self.percentile(p, counts) * scale for p in PERCENTILES}}
+        return {'count': self.count, 'mean': self.mean() * scale,
+                'min': (self.min or 0) * scale, 'max': (self.max or 0) * scale,
+                **{f'p{p}': self.percentile(p) * scale for p in PERCENTILES}}
+
+
+"""Service-level metrics of a run: latency and utilization histograms, shown live and logged
+
+    wait         order created -> assigned to a robot (simulated ms)
+    assignment   wall time of one assignment round (µs)
+    delivery     order created -> delivered (simulated ms)
+    utilization  share of the fleet busy delivering or heading home, sampled every tick (%)
+
+Recording costs a few integer operations, so it stays on for every run. With `path` set, a JSON
+line with the run-to-date and since-last-line summaries is appended every `interval` ms of
+simulated time, and once more by close().
+"""
+class ServiceMetrics:
+    def __init__(self, path=None, interval=EXPORT_INTERVAL_MS):
+        self.histograms = {
+            'wait': Histogram(24 * 3600 * 1000),
+            'assignment': Histogram(60 * 10 ** 6),
+            'delivery': Histogram(24 * 3600 * 1000),
+            'utilization': Histogram(100),
+        }
+        self.wait = self.histograms['wait']
+        self.assignment = self.histograms['assignment']
+        self.delivery = self.histograms['delivery']
+        self.utilization = self.histograms['utilization']
+        self.busy_robots = 0                            # Robot objects busy right now, kept by Robot.set_busy()
+        self.path = path
+        self.interval = interval
+        self.next_export = interval                     # Elapsed ms of the next log line
+        self.exported = 0                               # Elapsed ms of the last one
+        self.last = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+        self.file = open(path, 'w') if path else None
+
+    '''An order was assigned at `now` (ms)'''
+    def order_assigned(self, order, now):
+        self.wait.record(now - order.created_time)
+
+    '''An order was delivered at `now` (ms)'''
+    def order_delivered(self, order, now):
+        self.delivery.record(now - order.created_time)
+
+    '''An assignment round took `seconds` of wall time'''
+    def assignment_round(self, seconds):
+        self.assignment.record(seconds * 1e6)
+
+    '''`busy` robots out of `robots` were working, for `ticks` ticks'''
+    def fleet_busy(self, busy, robots, ticks=1):
+        if robots and ticks > 0:
+            self.utilization.record(100 * busy // robots, ticks)
+
+    '''Run-to-date summary of every histogram, times in seconds (wait, delivery) or ms (assignment)'''
+    def report(self):
+        return {
+            'wait_s': self.wait.summary(1 / 1000),
+            'assignment_ms': self.assignment.summary(1 / 1000),
+            'delivery_s': self.delivery.summary(1 / 1000),
+            'utilization_pct': self.utilization.summary(),
+        }
+
+    '''Lines for the live stats panel'''
+    def overlay_lines(self):
+        lines = []
+        for label, histogram, scale, unit in (('wait', self.wait, 1 / 1000, 's'),
+                                              ('delivery', self.delivery, 1 / 1000, 's'),
+                                              ('assign', self.assignment, 1 / 1000, 'ms')):
+            p50, p95, p99 = (histogram.percentile(p) * scale for p in PERCENTILES)
+            lines.append(f"{label} p50/95/99: {p50:.1f}/{p95:.1f}/{p99:.1f} {unit}")
+        busy = self.utilization
+        lines.append(f"busy robots p50/95: {busy.percentile(50)}/{busy.percentile(95)}%")
+        return lines
+
+    '''Append a log line if `elapsed_ms` reached the next export time'''
+    def tick(self, elapsed_ms):
+        if self.file and elapsed_ms >= self.next_export:
+            self.export(elapsed_ms)
+            self.next_export = (elapsed_ms // self.interval + 1) * self.interval
+
+    '''Append one line: run-to-date summaries plus those of the values recorded since the previous line'''
+    def export(self, elapsed_ms):
+        scales = {'wait': 1 / 1000, 'assignment': 1 / 1000, 'delivery': 1 / 1000, 'utilization': 1}
+        record = {'t': elapsed_ms}
+        for name, histogram in self.histograms.items():
+            counts = histogram.snapshot()
+            record[name] = dict(histogram.summary(scales[name]),
+                                interval=histogram.summary(scales[name], counts - self.last[name]))
+            self.last[name] = counts
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.file.flush()
+        self.exported = elapsed_ms
+
+    def close(self, elapsed_ms=None):
+        if self.file:
+            if elapsed_ms is not None and elapsed_ms > self.exported:
+                self.export(elapsed_ms)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,66 @@
+"""Grid-bucket index of the active orders
+
+Every active order is registered by location for O(1) occupancy checks, and unassigned orders
+are also kept in square buckets of `bucket_size` cells so radius queries only visit nearby buckets.
+"""
+class SpatialIndex:
+    def __init__(self, bucket_size=5):
+        self.bucket_size = bucket_size  # Width of a bucket in cells
+        self.buckets = {}               # (bx, by) -> {order_id: order} of unassigned orders
+        self.locations = {}             # location -> order, for every active order
+
+    def __contains__(self, location):
+        return location in self.locations
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _bucket_key(self, location):
+        return location[0] // self.bucket_size, location[1] // self.bucket_size
+
+    '''Register a new order; unassigned orders become visible to radius queries'''
+    def add(self, order):
+        self.locations[order.location] = order
+        if not order.assigned:
+            self.buckets.setdefault(self._bucket_key(order.location), {})[order.order_id] = order
+
+    '''Hide an order from radius queries once a robot has taken it'''
+    def mark_assigned(self, order):
+        key = self._bucket_key(order.location)
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.pop(order.order_id, None)
+            if not bucket:
+                del self.buckets[key]
+
+    '''Forget an order entirely, e.g. when it leaves the map'''
+    def remove(self, order):
+        self.mark_assigned(order)
+        if self.locations.get(order.location) is order:
+            del self.locations[order.location]
+
+    '''Copy of the buckets for one round of radius queries, so orders can be hidden without touching this index'''
+    def snapshot(self):
+        copy = SpatialIndex(self.bucket_size)
+        copy.buckets = {key: dict(bucket) for key, bucket in self.buckets.items()}
+        copy.locations = self.locations             # Shared, only read for occupancy
+        return copy
+
+    '''Unassigned orders within `radius` (Euclidean) of `center`'''
+    def query_radius(self, center, radius):
+        cx, cy = center
+        bx, by = self._bucket_key(center)
+        reach = -(-radius // self.bucket_size)                  # Buckets to scan on each side (ceil division)
+        limit = radius * radius
+        found = []
+        for i in range(bx - reach, bx + reach + 1):
+            for j in range(by - reach, by + reach + 1):
+                bucket = self.buckets.get((i, j))
+                if not bucket:
+                    continue
+                for order in bucket.values():
+                    dx = order.location[0] - cx
+                    dy = order.location[1] - cy
+                    if dx * dx + dy * dy <= limit:
+                        found.append(order)
+        return found
@@ -0,0 +1,162 @@
+import gzip
+import json
+import queue
+import socket
+import threading
+
+BUFFER_SIZE = 1024                    # Orders read ahead of the simulation before the reader blocks
+POLL_TIMEOUT = 0.2                    # Seconds the socket reader waits on accept() or a full buffer before checking for close()
+
+
+def _open(path, mode):
+    return gzip.open(path, mode + 't') if path.endswith('.gz') else open(path, mode)
+
+
+'''Parse JSONL order lines into (time in ms since the start of the run, (x, y)), in input order
+
+A line is {"t": 1500, "loc": [3, 7]}; "t" defaults to 0 (due at once). Lines of a trace written by
+TraceRecorder that are not orders are skipped, so a trace replays its own orders.
+'''
+def parse_orders(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if record.get('ev', 'order') != 'order':
+                continue
+            x, y = record['loc']
+            yield int(record.get('t', 0)), (int(x), int(y))
+        except (ValueError, KeyError, TypeError) as error:
+            print(f"[WARNING] Skipping order line {number}: {error}")
+
+
+"""Timestamped orders handed to the simulation as they fall due
+
+Subclasses provide _read(): the next record if one is available right now, else None.
+next_due() keeps one record of lookahead and only hands it over once the run has reached its time.
+"""
+class OrderSource:
+    def __init__(self):
+        self.pending = None             # Next record, read but not due yet
+
+    def _read(self):
+        raise NotImplementedError
+
+    '''The next record due at `elapsed_ms` into the run, or None'''
+    def next_due(self, elapsed_ms):
+        if self.pending is None:
+            self.pending = self._read()
+        if self.pending is None or self.pending[0] > elapsed_ms:
+            return None
+        record, self.pending = self.pending, None
+        return record
+
+    def close(self):
+        pass
+
+
+"""Orders replayed from a JSONL file (or .jsonl.gz), read lazily on the simulation thread
+
+Only one line is read ahead, and reading never races the clock, so a replay is deterministic.
+"""
+class FileOrderSource(OrderSource):
+    def __init__(self, path):
+        super().__init__()
+        self.file = _open(path, 'r')
+        self.records = parse_orders(self.file)
+
+    def _read(self):
+        return next(self.records, None)
+
+    def close(self):
+        self.file.close()
+
+
+"""Live orders sent as JSONL lines by clients of a local TCP socket
+
+A reader thread accepts one client after the other and parses their lines into a bounded queue.
+When the simulation falls behind and the queue is full, the reader blocks, stops reading the socket,
+and the clients are slowed down by TCP flow control instead of the orders piling up in memory.
+close() shuts the current client down; the reader notices it within POLL_TIMEOUT while waiting.
+"""
+class SocketOrderSource(OrderSource):
+    def __init__(self, port, host='127.0.0.1', buffer_size=BUFFER_SIZE):
+        super().__init__()
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]            # Actual port when `port` is 0
+        self.server.settimeout(POLL_TIMEOUT)
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.closed = threading.Event()
+        self.connection = None                              # Client being read, shut down by close()
+        self.thread = threading.Thread(target=self._serve, name='order-socket', daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        try:
+            while not self.closed.is_set():
+                try:
+                    connection, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                self.connection = connection
+                if self.closed.is_set():                    # close() ran before the client was recorded
+                    connection.close()
+                    return
+                with connection, connection.makefile('r') as lines:
+                    for record in parse_orders(lines):
+                        if not self._put(record):
+                            return
+                self.connection = None
+        except OSError:
+            pass                                            # Socket closed under the reader
+
+    # Queue `record`, waiting while the buffer is full (backpressure); False if the source was closed meanwhile
+    def _put(self, record):
+        while not self.closed.is_set():
+            try:
+                self.buffer.put(record, timeout=POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self):
+        try:
+            return self.buffer.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed.set()
+        connection = self.connection
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)       # Wakes the reader out of recv()
+            except OSError:
+                pass
+        self.thread.join()
+        self.server.close()
+
+
+"""Writes order and assignment events of a run to a compact JSONL trace (gzipped if the path ends in .gz)
+
+Times are ms since the start of the run. The order lines are the FileOrderSource format, so a trace
+can be fed back with --orders to replay the same demand.
+"""
+class TraceRecorder:
+    def __init__(self, path):
+        self.file = _open(path, 'w')
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def order(self, elapsed_ms, order):
+        self._write({'t': elapsed_ms, 'ev': 'order', 'id': order.order_id, 'loc': list(order.location)})
+
+    def assignment(self, elapsed_ms, robot_id, order_ids):
+        self._write({'t': elapsed_ms, 'ev': 'assign', 'robot': robot_id, 'orders': order_ids})
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,139 @@
+"""Seeded scenario sweeps: many headless simulations over a grid of parameters, run in parallel.
+
+Every combination of map size, obstacle ratio, robot count, batch size and planner is simulated once
+per seed in a pool of worker processes. The seed fixes both the map and the orders, so any row can
+be reproduced on its own. Results are written one row per run, plus a summary averaged over seeds:
+
+    python sweep.py --map-size 25 40 --robots 3 6 --planner astar jps --seeds 5 --out results.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import MAP_SIZE, OBSTACLE_RATIO, FW_LOCATION
+from map import generate_map
+from distance import distance_field
+from simulation import Simulation, Robot
+from assignment import MAX_ORDERS_PER_ROBOT
+from events import EventScheduler
+from pathfinding import PLANNERS
+
+PREFILL_ORDERS = 12                   # Orders placed before the clock starts, as in main.py
+PARAMETERS = ('map_size', 'obstacle_ratio', 'robots', 'max_orders_per_robot', 'planner')
+METRICS = ('throughput_per_hour', 'avg_delivery_time', 'delivered_orders', 'total_orders')
+
+
+'''Simulate one scenario headlessly and return its result row'''
+def run_scenario(scenario):
+    grid, _ = generate_map(scenario['map_size'], scenario['obstacle_ratio'], seed=scenario['seed'])
+    row = dict(scenario)
+    if (distance_field(grid, FW_LOCATION) > 0).sum() == 0:
+        row['error'] = "warehouse enclosed by obstacles"        # No order could ever be placed
+        return row
+
+    robots = [Robot(f'R{i + 1}', FW_LOCATION) for i in range(scenario['robots'])]
+    sim = Simulation(grid, [], robots, headless=True, planner=scenario['planner'], seed=scenario['seed'],
+                     max_orders_per_robot=scenario['max_orders_per_robot'])
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):             # Keep the per-assignment logs out of the report
+        sim.create_orders(PREFILL_ORDERS)
+        sim.assign_orders_in_batch()
+        stats = EventScheduler(sim).run(scenario['duration'])   # Same outcomes as the tick loop, faster
+    delivered = stats['delivered_orders']
+    row.update(
+        total_orders=stats['total_orders'],
+        delivered_orders=delivered,
+        throughput_per_hour=delivered * 3600 / scenario['duration'],
+        avg_delivery_time=sum(robot.total_delivery_time for robot in robots) / delivered if delivered else 0,
+        wall_seconds=round(time.perf_counter() - started, 3),
+        error='',
+    )
+    return row
+
+
+'''Every combination of the parameter lists, once per seed'''
+def scenarios(map_sizes, obstacle_ratios, robot_counts, max_orders, planners, seeds, duration):
+    for values in itertools.product(map_sizes, obstacle_ratios, robot_counts, max_orders, planners):
+        for seed in seeds:
+            yield dict(zip(PARAMETERS, values), seed=seed, duration=duration)
+
+
+'''Mean and standard deviation of every metric over the seeds of each parameter combination'''
+def summarize(rows):
+    groups = {}
+    for row in rows:
+        if not row.get('error'):
+            groups.setdefault(tuple(row[name] for name in PARAMETERS), []).append(row)
+    summary = []
+    for values, runs in groups.items():
+        entry = dict(zip(PARAMETERS, values), runs=len(runs))
+        for metric in METRICS:
+            samples = [run[metric] for run in runs]
+            entry[f'{metric}_mean'] = statistics.fmean(samples)
+            entry[f'{metric}_std'] = statistics.stdev(samples) if len(samples) > 1 else 0.0
+        summary.append(entry)
+    return summary
+
+
+'''Write rows to CSV, or to Parquet when the path ends in .parquet (needs pandas and pyarrow)'''
+def write_table(rows, path):
+    if path.endswith('.parquet'):
+        try:
+            import pandas
+        except ImportError:
+            raise SystemExit("Writing .parquet files needs pandas and pyarrow; use a .csv path instead")
+        pandas.DataFrame(rows).to_parquet(path, index=False)
+        return
+    columns = list(dict.fromkeys(name for row in rows for name in row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+'''Run every scenario in `workers` processes and return the rows in scenario order'''
+def run_sweep(scenario_list, workers=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = []
+        for row in pool.map(run_scenario, scenario_list):
+            rows.append(row)
+            params = ', '.join(f"{name}={row[name]}" for name in PARAMETERS + ('seed',))
+            outcome = row['error'] or f"{row['delivered_orders']} delivered, avg {row['avg_delivery_time']:.2f}s"
+            print(f"[INFO] {len(rows)}/{len(scenario_list)} {params}: {outcome}")
+    return rows
+
+
+def _summary_path(path):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_summary{ext}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run seeded headless FOODIE simulations over a parameter grid")
+    parser.add_argument('--map-size', type=int, nargs='+', default=[MAP_SIZE])
+    parser.add_argument('--obstacle-ratio', type=float, nargs='+', default=[OBSTACLE_RATIO])
+    parser.add_argument('--robots', type=int, nargs='+', default=[3])
+    parser.add_argument('--max-orders', type=int, nargs='+', default=[MAX_ORDERS_PER_ROBOT],
+                        help="Largest batch a robot takes at once (MAX_ORDERS_PER_ROBOT)")
+    parser.add_argument('--planner', nargs='+', default=['astar'], choices=sorted(PLANNERS))
+    parser.add_argument('--seeds', type=int, default=3, help="Runs per combination, seeded 0 .. N-1")
+    parser.add_argument('--duration', type=float, default=600, help="Simulated seconds per run")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--out', default='sweep.csv', help="Per-run results; the summary goes next to it")
+    args = parser.parse_args()
+
+    if min(args.map_size) <= max(FW_LOCATION):
+        parser.error(f"every map size must be larger than {max(FW_LOCATION)} to hold the warehouse at {FW_LOCATION}")
+
+    scenario_list = list(scenarios(args.map_size, args.obstacle_ratio, args.robots, args.max_orders,
+                                   args.planner, range(args.seeds), args.duration))
+    rows = run_sweep(scenario_list, args.workers)
+    write_table(rows, args.out)
+    write_table(summarize(rows), _summary_path(args.out))
+    print(f"[INFO] Wrote {len(rows)} runs to {args.out} and the summary to {_summary_path(args.out)}")
@@ -0,0 +1,79 @@
+import numpy as np
+from distance import nearest_source_field, repair_field, UNREACHABLE
+
+
+"""The warehouses of a map and, for every cell, the nearest one
+
+One multi-source flood fill labels each cell with the moves to its nearest warehouse and which
+warehouse that is, so sending a robot home or ranking an order by how close it is to a warehouse
+is an array lookup however many warehouses there are. The straight-line distance to that nearest
+warehouse, used by order_priority(), is precomputed alongside. update_cells() repairs the fill
+around cells that changed, rebuild() runs it again; `tables` (distance, index) taken from a map
+file skip the first one.
+"""
+class Warehouses:
+    def __init__(self, grid, locations, tables=None):
+        self.grid = grid
+        self.locations = [tuple(location) for location in locations]
+        if not self.locations:
+            raise ValueError("At least one warehouse is needed")
+        self.cells = set(self.locations)
+        self.width = grid.shape[1]      # Cells are stored as x * width + y
+        self.flat = np.array([x * self.width + y for x, y in self.locations], dtype=np.int64)
+        self.distance = None            # Moves from each cell to its nearest warehouse, -1 if none is reachable
+        self.index = None               # Index in `locations` of that warehouse, -1 likewise
+        self.straight = None            # Straight-line distance to it, inf likewise
+        if tables is None:
+            self.rebuild()
+        else:
+            self.distance, self.index = tables
+            self._straight()
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __iter__(self):
+        return iter(self.locations)
+
+    def __contains__(self, cell):
+        return cell in self.cells
+
+    '''Flood fill from every warehouse again, e.g. after cells were blocked or cleared'''
+    def rebuild(self):
+        self.distance, self.index = nearest_source_field(self.grid, self.locations)
+        self._straight()
+
+    '''Repair the fill after `cells` were blocked or cleared, touching only the cells it changes for'''
+    def update_cells(self, cells):
+        if not self.distance.flags.writeable:
+            self.distance, self.index = self.distance.copy(), self.index.copy()    # Tables from a map file
+        changed = repair_field(self.grid, self.distance, cells, self.index)
+        if changed is None:
+            self.rebuild()
+        elif changed:
+            rows, cols = np.array(list(changed)).T
+            self.straight[rows, cols] = self._distances(rows, cols)
+
+    def _straight(self):
+        rows, cols = np.indices(self.grid.shape)
+        self.straight = self._distances(rows, cols)
+
+    # Straight-line distance from the cells (rows, cols) to their nearest warehouse, inf if there is none
+    def _distances(self, rows, cols):
+        x = np.array([location[0] for location in self.locations], dtype=np.float64)
+        y = np.array([location[1] for location in self.locations], dtype=np.float64)
+        index = self.index[rows, cols]
+        nearest = np.maximum(index, 0)
+        dx = rows - x[nearest]
+        dy = cols - y[nearest]
+        return np.where(index == UNREACHABLE, np.inf, np.sqrt(dx * dx + dy * dy))
+
+    '''The warehouse nearest to `cell` by path, or None if no warehouse can be reached from it'''
+    def nearest(self, cell):
+        index = self.index[cell]
+        return self.locations[index] if index != UNREACHABLE else None
+
+    '''Moves from `cell` to its nearest warehouse, or None if no warehouse can be reached'''
+    def moves(self, cell):
+        d = self.distance[cell]
+        return int(d) if d != UNREACHABLE else None